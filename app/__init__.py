@@ -20,6 +20,16 @@ def create_app():
     app.config["SESSION_PERMANENT"] = True
     Session(app)
 
+    # --- Database Pool ---
+    # Every request borrows one pooled connection and returns it on teardown
+    from . import db
+    db.init_app(app)
+
+    # --- Background Jobs ---
+    # Started per process on its first request (see background.py)
+    from . import background
+    background.init_app(app)
+
 
     # ---
     # 3. Simplify CORS
@@ -70,11 +80,22 @@ def create_app():
 
     from . import discounts    
     app.register_blueprint(discounts.discounts_bp)
+
+    from . import export
+    app.register_blueprint(export.export_bp)
     
     @app.route("/health")
     def health():
         return "OK", 200
 
+    # Pool internals are for managers only
+    from .decorators import manager_required
+
+    @app.route("/health/db")
+    @manager_required
+    def health_db():
+        return jsonify(db.pool_stats()), 200
+
     @app.route('/music.mp3')
     def music():
         return send_from_directory(os.path.join(app.template_folder), 'music.mp3')
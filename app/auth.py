@@ -3,7 +3,7 @@
 import os
 from flask import Blueprint, jsonify, session, redirect, url_for
 from flask_dance.contrib.google import make_google_blueprint, google
-from .db import get_db_connection
+from .db import get_db
 from .decorators import login_required
 
 # 1. Create the main auth blueprint
@@ -65,7 +65,7 @@ def google_callback():
         return jsonify({"error": "Failed to fetch user info from Google", "details": str(e)}), 500
 
     # Now, find this user in our 'staff' table
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
 
@@ -74,7 +74,6 @@ def google_callback():
         cur.execute("SELECT staff_id, name, role FROM staff WHERE email = %s", (user_email,))
         staff_member = cur.fetchone()
         cur.close()
-        conn.close()
 
         if staff_member:
             # User is found! Create a session.
@@ -0,0 +1,46 @@
+# server_flask/app/background.py
+#
+# Periodic background jobs (sweeps, flushers, compaction...).
+#
+# Jobs are registered at import time but their threads are only started on the
+# first request a process serves. That way each gunicorn worker gets its own
+# threads after the fork, instead of threads that only existed in the master.
+
+import os
+import threading
+import time
+
+_jobs = []
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def periodic(name, interval, fn):
+    """Registers fn() to run every `interval` seconds on its own daemon thread."""
+    _jobs.append((name, interval, fn))
+
+
+def _run(name, interval, fn):
+    while True:
+        time.sleep(interval)
+        try:
+            fn()
+        except Exception as e:
+            print(f"Background job {name} failed: {e}")
+
+
+def ensure_started():
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        for name, interval, fn in _jobs:
+            threading.Thread(target=_run, args=(name, interval, fn), name=name, daemon=True).start()
+
+
+def init_app(app):
+    if os.environ.get("BACKGROUND_JOBS", "1") != "0":
+        app.before_request(ensure_started)
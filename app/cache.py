@@ -0,0 +1,210 @@
+# server_flask/app/cache.py
+#
+# Small in-process caches shared by the blueprints.
+#
+# Everything here lives in one server process, so with several gunicorn workers
+# each worker has its own copy and write invalidations only reach the worker
+# that handled the write; the TTL bounds how stale the other workers can be.
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+
+# --- Change notifications ---
+# Write endpoints call notify("orders" / "products" / "inventory") after they commit,
+# and anything caching data derived from those tables subscribes to the topic.
+# Stored menu translations have their own topic, "product_translations".
+
+_listeners = defaultdict(list)
+
+
+def subscribe(topic, callback):
+    _listeners[topic].append(callback)
+
+
+def notify(topic):
+    for callback in list(_listeners[topic]):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Cache listener for '{topic}' failed: {e}")
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until", "version")
+
+    def __init__(self, value, fresh_until, stale_until, version):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.version = version
+
+
+class SWRCache:
+    """
+    A keyed TTL cache with stale-while-revalidate and single-flight loading.
+
+    - fresh entries (younger than `ttl`) are returned as is
+    - stale entries (younger than `ttl + stale_ttl`, or invalidated) are returned
+      immediately while one background thread reloads them
+    - on a miss, only one caller runs the loader; concurrent callers for the
+      same key wait for its result instead of calling the loader again
+    """
+
+    def __init__(self, name, ttl, stale_ttl=0, max_entries=None):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._loading = {}  # key -> threading.Event of the in-flight load
+        self._version = 0   # bumped by invalidate(), so loads started before it aren't trusted as fresh
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.invalidations = 0
+        self.total_load_time = 0.0
+        self.last_load_time = 0.0
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == self._version and now < entry.fresh_until:
+                self.hits += 1
+                return entry.value
+            if entry is not None and now < entry.stale_until:
+                self.stale_hits += 1
+                if key not in self._loading:
+                    self._loading[key] = threading.Event()
+                    threading.Thread(target=self._load, args=(key, loader), daemon=True).start()
+                return entry.value
+            self.misses += 1
+            event = self._loading.get(key)
+            if event is None:
+                self._loading[key] = threading.Event()
+
+        if event is not None:
+            # Someone else is already loading this key
+            event.wait()
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None:
+                return entry.value
+            # Their load failed; try ourselves
+            return self.get(key, loader)
+
+        return self._load(key, loader, raise_errors=True)
+
+    def _load(self, key, loader, raise_errors=False):
+        with self._lock:
+            version = self._version
+        start = time.monotonic()
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self.load_errors += 1
+                self._loading.pop(key).set()
+            if raise_errors:
+                raise
+            print(f"Background refresh of {self.name}[{key}] failed: {e}")
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - start
+            self.loads += 1
+            self.total_load_time += elapsed
+            self.last_load_time = elapsed
+            # If an invalidation happened while we were loading, keep the value
+            # (it's still the best we have) but let the next caller refresh it again.
+            self._entries[key] = _Entry(value, now + self.ttl, now + self.ttl + self.stale_ttl, version)
+            if self.max_entries and len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k].fresh_until)
+                del self._entries[oldest]
+            self._loading.pop(key).set()
+        return value
+
+    def peek(self, key):
+        """Returns the cached value (fresh or stale) without loading, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry.stale_until:
+                return entry.value
+        return None
+
+    def invalidate(self):
+        """Marks every entry stale. Stale values are still served while they reload."""
+        with self._lock:
+            self._version += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "stale_ttl_seconds": self.stale_ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "load_errors": self.load_errors,
+                "invalidations": self.invalidations,
+                "avg_load_ms": round(1000 * self.total_load_time / self.loads, 3) if self.loads else 0.0,
+                "last_load_ms": round(1000 * self.last_load_time, 3),
+            }
+
+
+class LRUCache:
+    """A bounded, thread-safe least-recently-used map (no TTL), for values that never go stale."""
+
+    def __init__(self, name, max_entries):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
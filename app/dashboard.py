@@ -1,9 +1,32 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from flask import Blueprint, jsonify
-from .db import get_db_connection
+from .db import pooled_connection
 from .decorators import manager_required
+from .cache import SWRCache, subscribe
+from .inventory_ledger import CURRENT_INVENTORY_SQL
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
 
+# The stats are the same for every manager, so one cached payload serves everyone.
+# Writes to orders/products/inventory mark it stale; a stale payload is still served
+# (for up to DASHBOARD_CACHE_STALE_TTL seconds) while it is recomputed in the background.
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', 60))
+DASHBOARD_CACHE_STALE_TTL = float(os.environ.get('DASHBOARD_CACHE_STALE_TTL', 600))
+
+# The sections are independent, so they run concurrently, each on its own pooled
+# connection. Keep DASHBOARD_WORKERS below DB_POOL_MAX so the dashboard can't starve checkout.
+DASHBOARD_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', 4))
+DASHBOARD_SECTION_TIMEOUT = float(os.environ.get('DASHBOARD_SECTION_TIMEOUT', 5))
+
+stats_cache = SWRCache("dashboard_stats", ttl=DASHBOARD_CACHE_TTL, stale_ttl=DASHBOARD_CACHE_STALE_TTL)
+_executor = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix="dashboard")
+
+for _topic in ("orders", "products", "inventory"):
+    subscribe(_topic, stats_cache.invalidate)
+
+
 @dashboard_bp.route('/stats', methods=['GET'])
 @manager_required
 def get_dashboard_stats():
@@ -12,272 +35,364 @@ def get_dashboard_stats():
     Includes: Revenue trends, top products, staff performance,
               inventory alerts, order patterns, and category breakdown
     """
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({"error": "Database connection failed"}), 500
-
     try:
-        cur = conn.cursor()
-
-        cur.execute("SET TIME ZONE 'America/Chicago';")
-        
-        # ========================================
-        # 1. REVENUE: Last 30 Days (Line Chart)
-        # ========================================
-        cur.execute("""
-            SELECT 
-                CONCAT(o.year, '-', LPAD(o.month::text, 2, '0'), '-', LPAD(o.day::text, 2, '0')) AS date,
-                COALESCE(SUM(o.total_price + o.tip), 0) AS daily_total
-            FROM orders o
-            WHERE MAKE_DATE(o.year, o.month, o.day) >= CURRENT_DATE - INTERVAL '30 days'
-            GROUP BY o.year, o.month, o.day
-            ORDER BY o.year, o.month, o.day
-            LIMIT 30;
-        """)
-        revenue_over_time = [
-            {"date": str(row[0]), "revenue": float(row[1])}
-            for row in cur.fetchall()
-        ]
-
-        total_revenue = sum(item["revenue"] for item in revenue_over_time)
-
-        # ========================================
-        # 2. TOP 10 BEST-SELLING PRODUCTS (Bar Chart)
-        # ========================================
-        cur.execute("""
+        payload = stats_cache.get("stats", _compute_stats)
+    except Exception as e:
+        print(str(e))
+        return jsonify({"error": str(e)}), 500
+
+    if payload["meta"]["failed"]:
+        # Don't keep serving a partial payload as fresh; the next request will refresh it
+        stats_cache.invalidate()
+    return jsonify(payload)
+
+
+@dashboard_bp.route('/stats/cache', methods=['GET'])
+@manager_required
+def get_dashboard_cache_stats():
+    """ Hit/miss/recompute-time counters for the dashboard cache. """
+    return jsonify(stats_cache.stats())
+
+
+def _run_section(section):
+    start = time.monotonic()
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            # CURRENT_DATE is in Chicago time; statement_timeout makes the server give up
+            # on a query we have already stopped waiting for. Both are reset at rollback.
+            cur.execute("SET LOCAL TIME ZONE 'America/Chicago';")
+            cur.execute("SET LOCAL statement_timeout = %s;", (int(DASHBOARD_SECTION_TIMEOUT * 1000),))
+            result = section(cur)
+        conn.rollback()
+    return result, time.monotonic() - start
+
+
+def _compute_stats():
+    """
+    Runs all dashboard sections concurrently and returns the payload served by /stats.
+    Everything except the inventory and whale-order charts reads the daily rollups (see rollups.py).
+    The payload is ready after at most DASHBOARD_SECTION_TIMEOUT: any section that
+    failed or hasn't finished by then is replaced by {"error": ...} instead of
+    failing (or holding up) the whole payload.
+    """
+    started = time.monotonic()
+    futures = {name: _executor.submit(_run_section, section) for name, section in SECTIONS}
+
+    results = {}
+    timings = {}
+    failed = []
+    # One deadline for all sections; a section still queued for a thread by then
+    # is cancelled, and a running query gives up on its own via statement_timeout.
+    deadline = started + DASHBOARD_SECTION_TIMEOUT
+    for name, future in futures.items():
+        try:
+            results[name], elapsed = future.result(timeout=max(0, deadline - time.monotonic()))
+            timings[name] = {"ok": True, "ms": round(1000 * elapsed, 1)}
+        except FutureTimeoutError:
+            future.cancel()
+            results[name] = {"error": "Timed out"}
+            timings[name] = {"ok": False, "ms": round(1000 * (time.monotonic() - started), 1), "error": "timeout"}
+            failed.append(name)
+        except Exception as e:
+            print(f"Dashboard section {name} failed: {e}")
+            results[name] = {"error": str(e)}
+            timings[name] = {"ok": False, "error": str(e)}
+            failed.append(name)
+
+    if len(failed) == len(SECTIONS):
+        raise RuntimeError(results[failed[0]]["error"])
+
+    def ok(name, default):
+        return default if name in failed else results[name]
+
+    revenue_over_time = ok("revenueOverTime", [])
+    low_stock = ok("lowStockAlerts", [])
+
+    return {
+        "summary": {
+            "totalRevenue30Days": round(sum(item["revenue"] for item in revenue_over_time), 2),
+            "totalOrders30Days": len(revenue_over_time),
+            "lowStockItems": len(low_stock),
+            "today": results["today"]
+        },
+        "charts": {
+            "revenueOverTime": results["revenueOverTime"],
+            "topProducts": results["topProducts"],
+            "categoryBreakdown": results["categoryBreakdown"],
+            "hourlyOrders": results["hourlyOrders"],
+            "lowStockAlerts": results["lowStockAlerts"],
+            # New charts
+            "revenueConcentration": results["revenueConcentration"],
+            "toppingProfit": results["toppingProfit"],
+            "sizeAnalysis": results["sizeAnalysis"],
+            "whaleOrders": results["whaleOrders"],
+            "tipBehavior": results["tipBehavior"]
+        },
+        "meta": {
+            "computed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "total_ms": round(1000 * (time.monotonic() - started), 1),
+            "sections": timings,
+            "failed": failed
+        }
+    }
+
+
+# ========================================
+# 1. REVENUE: Last 30 Days (Line Chart)
+# ========================================
+def _revenue_over_time(cur):
+    cur.execute("""
+        SELECT 
+            TO_CHAR(sale_date, 'YYYY-MM-DD') AS date,
+            revenue + tips AS daily_total
+        FROM rollup_daily
+        WHERE sale_date >= CURRENT_DATE - 30
+        ORDER BY sale_date
+        LIMIT 30;
+    """)
+    return [
+        {"date": str(row[0]), "revenue": float(row[1])}
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 2. TOP 10 BEST-SELLING PRODUCTS (Bar Chart)
+# ========================================
+def _top_products(cur):
+    cur.execute("""
+        SELECT 
+            p.product_name,
+            COALESCE(SUM(r.items), 0) AS units_sold,
+            COALESCE(SUM(r.revenue), 0) AS revenue
+        FROM products p
+        LEFT JOIN rollup_product_daily r ON p.product_id = r.product_id
+        GROUP BY p.product_id, p.product_name
+        ORDER BY units_sold DESC, revenue DESC
+        LIMIT 10;
+    """)
+    return [
+        {
+            "name": row[0],
+            "units_sold": int(row[1]),
+            "revenue": float(row[2])
+        }
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 3. SALES BY CATEGORY (Pie / Donut Chart)
+# ========================================
+def _category_breakdown(cur):
+    cur.execute("""
+        SELECT p.category, 
+               COALESCE(SUM(r.items), 0) as items_sold
+        FROM products p
+        LEFT JOIN rollup_product_daily r ON p.product_id = r.product_id
+        GROUP BY p.category
+        ORDER BY items_sold DESC;
+    """)
+    return [
+        {"category": row[0] or "Uncategorized", "sold": int(row[1])}
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 4. ORDERS BY HOUR (Heatmap / Bar Chart)
+# ========================================
+def _hourly_orders(cur):
+    cur.execute("""
+        SELECT 
+            hour,
+            SUM(orders) AS order_count
+        FROM rollup_hour_daily
+        WHERE sale_date >= CURRENT_DATE - 7
+        GROUP BY hour
+        ORDER BY hour;
+    """)
+    return [
+        {"hour": int(row[0]), "count": int(row[1])}
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 6. INVENTORY LOW STOCK ALERTS (Critical!)
+# ========================================
+def _low_stock(cur):
+    cur.execute(f"""
+        SELECT 
+            name, 
+            units_remaining, 
+            numservings,
+            (units_remaining * numservings) AS total_servings_left
+        FROM ({CURRENT_INVENTORY_SQL}) AS inventory
+        WHERE (units_remaining * numservings) < 200
+        AND numservings > 0                     -- safety: avoid division-by-zero weirdness
+        ORDER BY total_servings_left ASC
+        LIMIT 10;
+    """)
+    return [
+        {
+            "name": row[0],
+            "remaining": int(row[1]),
+            "servings_per_unit": int(row[2]),
+            "servings_left": int(row[3])
+        }
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 7. TODAY'S SUMMARY (KPI Cards)
+# ========================================
+def _today_summary(cur):
+    cur.execute("""
+        SELECT 
+            COALESCE(SUM(orders), 0) AS orders_today,
+            COALESCE(SUM(revenue + tips), 0) AS revenue_today,
+            COALESCE(SUM(revenue + tips) / NULLIF(SUM(orders), 0), 0) AS avg_order_value
+        FROM rollup_daily
+        WHERE sale_date = CURRENT_DATE;
+    """)
+    today = cur.fetchone()
+    return {
+        "orders": int(today[0]),
+        "revenue": float(today[1]),
+        "avg_order": float(today[2])
+    }
+
+
+# ========================================
+# 8. REVENUE CONCENTRATION: % of revenue from top drinks
+# ========================================
+def _revenue_concentration(cur):
+    cur.execute("""
+        WITH product_revenue AS (
             SELECT 
                 p.product_name,
-                COUNT(i.item_id) AS units_sold,
-                COALESCE(SUM(i.price), 0) AS revenue
+                COALESCE(SUM(r.revenue), 0) AS revenue
             FROM products p
-            LEFT JOIN items i ON p.product_id = i.product_id
+            LEFT JOIN rollup_product_daily r ON p.product_id = r.product_id
             GROUP BY p.product_id, p.product_name
-            ORDER BY units_sold DESC, revenue DESC
-            LIMIT 10;
-        """)
-        top_products = [
-            {
-                "name": row[0],
-                "units_sold": int(row[1]),
-                "revenue": float(row[2])
-            }
-            for row in cur.fetchall()
-        ]
-
-        # ========================================
-        # 3. SALES BY CATEGORY (Pie / Donut Chart)
-        # ========================================
-        cur.execute("""
-            SELECT p.category, 
-                   COUNT(i.item_id) as items_sold
-            FROM products p
-            LEFT JOIN items i ON p.product_id = i.product_id
-            GROUP BY p.category
-            ORDER BY items_sold DESC;
-        """)
-        category_breakdown = [
-            {"category": row[0] or "Uncategorized", "sold": int(row[1])}
-            for row in cur.fetchall()
-        ]
-
-        # ========================================
-        # 4. ORDERS BY HOUR (Heatmap / Bar Chart)
-        # ========================================
-        cur.execute("""
-            SELECT 
-                EXTRACT(HOUR FROM CAST(o.time AS time))::int AS hour,
-                COUNT(*) AS order_count
-            FROM orders o
-            WHERE MAKE_DATE(o.year, o.month, o.day) >= CURRENT_DATE - INTERVAL '7 days'
-            GROUP BY hour
-            ORDER BY hour;
-        """)
-        hourly_orders = [
-            {"hour": int(row[0]), "count": int(row[1])}
-            for row in cur.fetchall()
-        ]
-
-
-        # ========================================
-        # 6. INVENTORY LOW STOCK ALERTS (Critical!)
-        # ========================================
-        cur.execute("""
-            SELECT 
-                name, 
-                units_remaining, 
-                numservings,
-                (units_remaining * numservings) AS total_servings_left
-            FROM inventory
-            WHERE (units_remaining * numservings) < 200
-            AND numservings > 0                     -- safety: avoid division-by-zero weirdness
-            ORDER BY total_servings_left ASC
-            LIMIT 10;
-        """)
-        low_stock = [
-            {
-                "name": row[0],
-                "remaining": int(row[1]),
-                "servings_per_unit": int(row[2]),
-                "servings_left": int(row[3])
-            }
-            for row in cur.fetchall()
-        ]
-
-        # ========================================
-        # 7. TODAY'S SUMMARY (KPI Cards)
-        # ========================================
-        cur.execute("""
-            SELECT 
-                COUNT(*) AS orders_today,
-                COALESCE(SUM(total_price + tip), 0) AS revenue_today,
-                COALESCE(AVG(total_price + tip), 0) AS avg_order_value
-            FROM orders
-            WHERE year = EXTRACT(YEAR FROM CURRENT_DATE)::int
-            AND month = EXTRACT(MONTH FROM CURRENT_DATE)::int
-            AND day = EXTRACT(DAY FROM CURRENT_DATE)::int;
-        """)
-        today = cur.fetchone()
-        today_stats = {
-            "orders": int(today[0]),
-            "revenue": float(today[1]),
-            "avg_order": float(today[2])
-        }
+        ),
+        totals AS (
+            SELECT SUM(revenue) AS total_revenue FROM product_revenue
+        )
+        SELECT 
+            product_name,
+            revenue,
+            ROUND(100.0 * revenue / total_revenue, 2) AS pct_of_total_revenue
+        FROM product_revenue, totals
+        WHERE revenue > 0
+        ORDER BY revenue DESC
+        LIMIT 15;
+    """)
+    return [
+        {"name": row[0], "revenue": float(row[1]), "pct": float(row[2])}
+        for row in cur.fetchall()
+    ]
 
-        # ========================================
-        # 8. REVENUE CONCENTRATION: % of revenue from top drinks
-        # ========================================
-        cur.execute("""
-            WITH product_revenue AS (
-                SELECT 
-                    p.product_name,
-                    COALESCE(SUM(i.price), 0) AS revenue
-                FROM products p
-                LEFT JOIN items i ON p.product_id = i.product_id
-                GROUP BY p.product_id, p.product_name
-            ),
-            totals AS (
-                SELECT SUM(revenue) AS total_revenue FROM product_revenue
-            )
-            SELECT 
-                product_name,
-                revenue,
-                ROUND(100.0 * revenue / total_revenue, 2) AS pct_of_total_revenue
-            FROM product_revenue, totals
-            WHERE revenue > 0
-            ORDER BY revenue DESC
-            LIMIT 15;
-        """)
-        revenue_concentration = [
-            {"name": row[0], "revenue": float(row[1]), "pct": float(row[2])}
-            for row in cur.fetchall()
-        ]
-
-        # ========================================
-        # 9. TOPPINGS REVENUE (The silent profit king)
-        # ========================================
-        cur.execute("""
-            SELECT 
-                CASE WHEN toppings = '' OR toppings IS NULL THEN 'No Toppings' ELSE toppings END AS topping_combo,
-                COUNT(*) AS times_ordered,
-                ROUND(SUM(i.price - p.price), 2) AS topping_revenue
-            FROM items i
-            JOIN products p ON i.product_id = p.product_id
-            GROUP BY topping_combo
-            ORDER BY topping_revenue DESC
-            LIMIT 10;
-        """)
-        topping_profit = [
-            {"combo": row[0], "orders": int(row[1]), "revenue": float(row[2])}
-            for row in cur.fetchall()
-        ]
-
-        # ========================================
-        # 10. SIZE IMPACT (Bucee's size dominance?)
-        # ========================================
-        cur.execute("""
-            SELECT 
-                size,
-                COUNT(*) AS items_sold,
-                ROUND(AVG(price), 2) AS avg_price,
-                ROUND(SUM(price), 2) AS total_revenue,
-                ROUND(100.0 * SUM(price) / (SELECT SUM(price) FROM items WHERE price > 0), 2) AS pct_of_revenue
-            FROM items
-            WHERE price > 0
-            GROUP BY size
-            ORDER BY total_revenue DESC;
-        """)
-        size_analysis = [
-            {"size": row[0], "sold": int(row[1]), "avg_price": float(row[2]), "revenue": float(row[3]), "pct": float(row[4])}
-            for row in cur.fetchall()
-        ]
-
-        # ========================================
-        # 11. WHALE ORDERS (Catering / VIP detection)
-        # ========================================
-        cur.execute("""
-            SELECT 
-                o.order_id,
-                o.time::text,
-                ROUND(o.total_price + o.tip, 2) AS grand_total,
-                COUNT(i.item_id) AS items_count
-            FROM orders o
-            LEFT JOIN items i ON o.order_id = i.order_id
-            GROUP BY o.order_id, o.time, o.total_price, o.tip
-            HAVING total_price + tip >= 150
-            ORDER BY grand_total DESC
-            LIMIT 15;
-        """)
-        whale_orders = [
-            {"id": row[0], "time": row[1], "total": float(row[2]), "items": int(row[3])}
-            for row in cur.fetchall()
-        ]
-
-        # ========================================
-        # 13. TIP BEHAVIOR BY PAYMENT METHOD
-        # ========================================
-        cur.execute("""
-            SELECT 
-                payment_method,
-                COUNT(*) AS orders,
-                ROUND(AVG(100.0 * tip / NULLIF(total_price, 0)), 2) AS avg_tip_pct,
-                ROUND(AVG(total_price + tip), 2) AS avg_order_value
-            FROM orders
-            WHERE total_price > 0
-            GROUP BY payment_method
-            ORDER BY avg_tip_pct DESC;
-        """)
-        tip_behavior = [
-            {"method": row[0], "orders": int(row[1]), "tip_pct": float(row[2]), "avg_order": float(row[3])}
-            for row in cur.fetchall()
-        ]
-
-        cur.close()
-        conn.close()
-
-        return jsonify({
-            "summary": {
-                "totalRevenue30Days": round(total_revenue, 2),
-                "totalOrders30Days": len(revenue_over_time),
-                "lowStockItems": len(low_stock),
-                "today": today_stats
-            },
-            "charts": {
-                "revenueOverTime": revenue_over_time,
-                "topProducts": top_products,
-                "categoryBreakdown": category_breakdown,
-                "hourlyOrders": hourly_orders,
-                "lowStockAlerts": low_stock,
-                # New charts
-                "revenueConcentration": revenue_concentration,
-                "toppingProfit": topping_profit,
-                "sizeAnalysis": size_analysis,
-                "whaleOrders": whale_orders,
-                "tipBehavior": tip_behavior
-            }
-        })
 
-    except Exception as e:
-        if conn:
-            conn.close()
-        print(str(e))
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+# ========================================
+# 9. TOPPINGS REVENUE (The silent profit king)
+# ========================================
+def _topping_profit(cur):
+    cur.execute("""
+        SELECT 
+            topping_combo,
+            SUM(items) AS times_ordered,
+            ROUND(SUM(revenue - base_revenue), 2) AS topping_revenue
+        FROM rollup_topping_daily
+        GROUP BY topping_combo
+        ORDER BY topping_revenue DESC
+        LIMIT 10;
+    """)
+    return [
+        {"combo": row[0], "orders": int(row[1]), "revenue": float(row[2])}
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 10. SIZE IMPACT (Bucee's size dominance?)
+# ========================================
+def _size_analysis(cur):
+    cur.execute("""
+        SELECT 
+            NULLIF(size, '') AS size,
+            SUM(items) AS items_sold,
+            ROUND(SUM(revenue) / SUM(items), 2) AS avg_price,
+            ROUND(SUM(revenue), 2) AS total_revenue,
+            ROUND(100.0 * SUM(revenue) / (SELECT SUM(revenue) FROM rollup_size_daily), 2) AS pct_of_revenue
+        FROM rollup_size_daily
+        GROUP BY size
+        ORDER BY total_revenue DESC;
+    """)
+    return [
+        {"size": row[0], "sold": int(row[1]), "avg_price": float(row[2]), "revenue": float(row[3]), "pct": float(row[4])}
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 11. WHALE ORDERS (Catering / VIP detection)
+# ========================================
+def _whale_orders(cur):
+    cur.execute("""
+        SELECT 
+            o.order_id,
+            o.time::text,
+            ROUND(o.total_price + o.tip, 2) AS grand_total,
+            (SELECT COUNT(*) FROM items i WHERE i.order_id = o.order_id) AS items_count
+        FROM orders o
+        WHERE o.total_price + o.tip >= 150       -- uses orders_grand_total_idx
+        ORDER BY o.total_price + o.tip DESC
+        LIMIT 15;
+    """)
+    return [
+        {"id": row[0], "time": row[1], "total": float(row[2]), "items": int(row[3])}
+        for row in cur.fetchall()
+    ]
+
+
+# ========================================
+# 13. TIP BEHAVIOR BY PAYMENT METHOD
+# ========================================
+def _tip_behavior(cur):
+    cur.execute("""
+        SELECT 
+            NULLIF(payment_method, '') AS payment_method,
+            SUM(orders) AS orders,
+            ROUND(SUM(tip_pct_sum) / NULLIF(SUM(tip_pct_count), 0), 2) AS avg_tip_pct,
+            ROUND(SUM(value_sum) / NULLIF(SUM(value_count), 0), 2) AS avg_order_value
+        FROM rollup_payment_daily
+        GROUP BY payment_method
+        ORDER BY avg_tip_pct DESC NULLS LAST;
+    """)
+    # The averages are NULL for a method with no priced orders
+    return [
+        {"method": row[0], "orders": int(row[1]), "tip_pct": _float_or_none(row[2]), "avg_order": _float_or_none(row[3])}
+        for row in cur.fetchall()
+    ]
+
+
+def _float_or_none(value):
+    return None if value is None else float(value)
+
+
+SECTIONS = (
+    ("revenueOverTime", _revenue_over_time),
+    ("topProducts", _top_products),
+    ("categoryBreakdown", _category_breakdown),
+    ("hourlyOrders", _hourly_orders),
+    ("lowStockAlerts", _low_stock),
+    ("today", _today_summary),
+    ("revenueConcentration", _revenue_concentration),
+    ("toppingProfit", _topping_profit),
+    ("sizeAnalysis", _size_analysis),
+    ("whaleOrders", _whale_orders),
+    ("tipBehavior", _tip_behavior),
+)
@@ -1,22 +1,248 @@
 # server_flask/app/db.py
 
 import os
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import extensions
 from dotenv import load_dotenv
+from flask import g
 
 # Load env variables for the db connection
 load_dotenv()
 
+# Pool sizing is per process (i.e. per gunicorn worker), so the total number of
+# server connections is roughly workers * DB_POOL_MAX.
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+
+
+def _connect():
+    return psycopg2.connect(
+        host=os.environ.get('DB_HOST'),
+        database=os.environ.get('DB_NAME'),
+        user=os.environ.get('DB_USER'),
+        password=os.environ.get('DB_PASS')
+    )
+
+
 def get_db_connection():
-    """Establishes a connection to the PostgreSQL database."""
+    """
+    Establishes a new, unpooled connection to the PostgreSQL database.
+    Only meant for scripts running outside of a request (e.g. genNewOrders.py);
+    request handlers should use get_db() instead.
+    """
     try:
-        conn = psycopg2.connect(
-            host=os.environ.get('DB_HOST'),
-            database=os.environ.get('DB_NAME'),
-            user=os.environ.get('DB_USER'),
-            password=os.environ.get('DB_PASS')
-        )
-        return conn
+        return _connect()
     except Exception as e:
         print(f"Error connecting to database: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the wait timeout."""
+
+
+class ConnectionPool:
+    """
+    A bounded, thread-safe pool of psycopg2 connections.
+    Callers block for up to `timeout` seconds when every connection is checked out.
+    """
+
+    def __init__(self, minconn, maxconn, timeout):
+        self.pid = os.getpid()
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._idle = []
+        self._size = 0  # open connections, idle + checked out
+        self._cond = threading.Condition()
+
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        # Pre-warm is best effort; getconn() will retry connecting on demand
+        try:
+            for _ in range(minconn):
+                self._idle.append(_connect())
+                self._size += 1
+        except Exception as e:
+            print(f"Error pre-warming database pool: {e}")
+
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Reserve the slot now, connect outside of the lock
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+
+        if conn is None:
+            try:
+                conn = _connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+            self.total_wait += elapsed
+            self.max_wait = max(self.max_wait, elapsed)
+        return conn
+
+    def putconn(self, conn):
+        """Returns a connection, rolling back anything left uncommitted."""
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+        if discard and not conn.closed:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pid": self.pid,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min": self.minconn,
+                "max": self.maxconn,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(1000 * self.total_wait / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 3),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Returns this process's pool, creating it lazily (and again after a fork)."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT)
+        return _pool
+
+
+def _reset_pool_after_fork():
+    # The parent's sockets must not be used (or closed!) by the child,
+    # so we simply forget about them and let get_pool() build a new pool.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def pool_stats():
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        return {"pid": os.getpid(), "size": 0, "idle": 0, "in_use": 0, "max": DB_POOL_MAX}
+    return pool.stats()
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Checks a pooled connection out for the duration of a with-block.
+    For work that runs outside of a request, e.g. on a worker thread.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def get_db():
+    """
+    Returns the pooled connection for the current request, checking one out on first use.
+    The connection goes back to the pool in close_db() when the request ends,
+    so handlers must NOT call conn.close() on it.
+    Returns None if the database can't be reached or the pool is exhausted.
+    """
+    if "db" not in g:
+        try:
+            pool = get_pool()
+            g.db = pool.getconn()
+            g.db_pool = pool
+        except Exception as e:
+            print(f"Error connecting to database: {e}")
+            return None
+    return g.db
+
+
+def close_db(e=None):
+    conn = g.pop("db", None)
+    pool = g.pop("db_pool", None)
+    if conn is None:
+        return
+    if pool is not None and pool.pid == os.getpid():
+        pool.putconn(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
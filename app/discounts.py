@@ -1,43 +1,246 @@
-from flask import Blueprint, request, jsonify
-from app.db import get_db_connection
+# server_flask/app/discounts.py
+#
+# Discount codes, checked and applied on the server.
+#
+# The whole discount_codes table is small, so it is kept in memory as a dict
+# keyed by code and reloaded every DISCOUNT_REFRESH_INTERVAL seconds by a
+# background job (or right away via POST /api/discounts/refresh). Checking a
+# code is a dict lookup: no query and no pooled connection on the request path.
+#
+# An unknown code might be one added since the last reload, so a miss schedules
+# a background reload (at most one per DISCOUNT_MISS_REFRESH_INTERVAL). The code
+# is then remembered as bad for DISCOUNT_NEGATIVE_TTL seconds, so guessing the
+# same codes over and over is answered from memory and reloads nothing.
+#
+# evaluate() works out the discount for a cart (percent or fixed), and add_order
+# uses it to check that a discounted order's total_price is what the code gives.
+
+import os
+import threading
+import time
 from datetime import datetime
+import pytz
+from flask import Blueprint, request, jsonify
+from .db import pooled_connection
+from .cache import LRUCache
+from .decorators import manager_required
+from . import background, schemas
 
 discounts_bp = Blueprint("discounts", __name__)
 
-@discounts_bp.route("/api/discounts/check", methods=["POST"])
-def check_discount():
-    data = request.get_json()
-    code = data.get("code", "").strip().upper()
+DISCOUNT_REFRESH_INTERVAL = float(os.environ.get('DISCOUNT_REFRESH_INTERVAL', 60))
+DISCOUNT_NEGATIVE_TTL = float(os.environ.get('DISCOUNT_NEGATIVE_TTL', 60))
+DISCOUNT_MISS_REFRESH_INTERVAL = float(os.environ.get('DISCOUNT_MISS_REFRESH_INTERVAL', 10))
 
-    if not code:
-        return jsonify({"valid": False, "reason": "No code provided"}), 400
+PERCENT_TYPES = ("percent", "percentage")
+FIXED_TYPES = ("fixed", "amount")
+
+# A total may be off by a rounding cent
+TOTAL_TOLERANCE = 0.01
+
+# Codes start and end on business days, which are in Chicago time
+chicago_tz = pytz.timezone("America/Chicago")
+
+
+class DiscountError(Exception):
+    """The code can't be used; status_code/reason are what check_discount answers."""
+
+    def __init__(self, reason, status_code):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
 
-    with get_db_connection() as conn:
+
+class Discount:
+    __slots__ = ("code", "discount_type", "value", "starts_on", "ends_on")
+
+    def __init__(self, code, discount_type, value, starts_on, ends_on):
+        self.code = code
+        self.discount_type = discount_type
+        self.value = value
+        self.starts_on = starts_on
+        self.ends_on = ends_on
+
+    def active_on(self, day):
+        return (self.starts_on is None or day >= self.starts_on) and (self.ends_on is None or day <= self.ends_on)
+
+    def amount(self, subtotal):
+        """The discount on a cart worth `subtotal`, never more than the cart itself."""
+        if self.discount_type in PERCENT_TYPES:
+            amount = subtotal * self.value / 100
+        else:
+            amount = self.value
+        return round(max(0.0, min(amount, subtotal)), 2)
+
+
+def _as_date(value):
+    return value.date() if hasattr(value, "date") else value
+
+
+_index = None
+_index_lock = threading.Lock()    # guards _index and _loaded_at
+_reload_lock = threading.Lock()   # one reload after misses at a time
+_loaded_at = 0.0
+_negative = LRUCache("discount-misses", 10000)  # unknown code -> remembered until (monotonic)
+
+
+def _load():
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT code, discount_type, value, starts_at, ends_at
-                FROM discount_codes
-                WHERE code = %s
-            """, (code,))
-            row = cur.fetchone()
+            cur.execute("SELECT code, discount_type, value, starts_at, ends_at FROM discount_codes;")
+            rows = cur.fetchall()
+        conn.rollback()
+
+    index = {}
+    for code, dtype, value, starts_at, ends_at in rows:
+        dtype = (dtype or "").strip().lower()
+        if dtype not in PERCENT_TYPES + FIXED_TYPES:
+            print(f"Skipping discount code {code}: unknown discount_type '{dtype}'")
+            continue
+        code = code.strip().upper()
+        index[code] = Discount(code, dtype, float(value), _as_date(starts_at), _as_date(ends_at))
+    return index
 
-    if not row:
-        return jsonify({"valid": False, "reason": "Invalid code"}), 404
 
-    code, dtype, value, starts_on, ends_on = row
+def _install(index):
+    # Caller holds _index_lock. Only a load that worked counts as one.
+    global _index, _loaded_at
+    if _index is not None and set(index) - set(_index):
+        # New codes: forget the misses, one of them may be a new code
+        _negative.clear()
+    _index = index
+    _loaded_at = time.monotonic()
+
+
+def refresh():
+    """Reloads every discount code into memory. Returns how many there are."""
+    index = _load()
+    with _index_lock:
+        _install(index)
+    return len(index)
+
+
+def _get_index():
+    # Loaded once on first use; the background job keeps it current after that
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _install(_load())
+    return _index
+
+
+def lookup(code, day=None):
+    """Returns the Discount for `code` if it can be used on `day` (default today in Chicago), or raises DiscountError."""
+    code = (code or "").strip().upper()
+    if not code:
+        raise DiscountError("No code provided", 400)
+    discount = _get_index().get(code)
+    if discount is None:
+        _record_miss(code)
+        raise DiscountError("Invalid code", 404)
+    if not discount.active_on(day or datetime.now(chicago_tz).date()):
+        raise DiscountError("Code expired or inactive", 410)
+    return discount
+
+
+def cart_subtotal(items):
+    """Sum of the items' prices; an item's price is already its line total (quantity included)."""
+    return round(sum(float(item.get("price") or 0) for item in items), 2)
+
+
+def evaluate(code, items, day=None):
+    """
+    Applies `code` to a cart (order items with their line price).
+    Returns {"code", "type", "value", "subtotal", "discount", "total"}; raises DiscountError.
+    """
+    discount = lookup(code, day)
+    subtotal = cart_subtotal(items)
+    amount = discount.amount(subtotal)
+    return {
+        "code": discount.code,
+        "type": discount.discount_type,
+        "value": discount.value,
+        "subtotal": subtotal,
+        "discount": amount,
+        "total": round(subtotal - amount, 2),
+    }
+
+
+def check_order_total(order, day=None):
+    """
+    For an order payload with a discount_code: checks the code and that total_price
+    is the discounted subtotal. Returns the discount amount to store with the order.
+    Raises DiscountError (the code) or ValueError (the total).
+    """
+    result = evaluate(order["discount_code"], order["items"], day)
+    if abs(float(order["total_price"]) - result["total"]) > TOTAL_TOLERANCE:
+        raise ValueError(
+            f"total_price {order['total_price']} doesn't match the discounted total {result['total']:.2f} "
+            f"({result['subtotal']:.2f} - {result['discount']:.2f} with {result['code']})"
+        )
+    return result["discount"]
+
+
+def _record_miss(code):
+    now = time.monotonic()
+    remembered_until = _negative.get(code)
+    if remembered_until is not None and remembered_until > now:
+        return  # a known bad code
+    _negative.put(code, now + DISCOUNT_NEGATIVE_TTL)
+    with _index_lock:
+        due = now - _loaded_at >= DISCOUNT_MISS_REFRESH_INTERVAL
+    if due and not _reload_lock.locked():
+        threading.Thread(target=_refresh_quietly, name="discounts-refresh", daemon=True).start()
+
+
+def _refresh_quietly():
+    if not _reload_lock.acquire(blocking=False):
+        return  # another miss is already reloading
+    try:
+        with _index_lock:
+            if time.monotonic() - _loaded_at < DISCOUNT_MISS_REFRESH_INTERVAL:
+                return
+        refresh()
+    except Exception as e:
+        print(f"Could not reload discount codes: {e}")
+    finally:
+        _reload_lock.release()
+
+
+@discounts_bp.route("/api/discounts/check", methods=["POST"])
+def check_discount():
+    """
+    Checks a code: {"code": "BOBA10"}. With the cart ({"code", "items": [...]})
+    the answer also has the subtotal, discount and discounted total.
+    """
+    try:
+        check = schemas.decode(request.get_data() or b"{}", schemas.DiscountCheck)
+    except schemas.InvalidRequest as e:
+        return jsonify({"valid": False, "reason": e.message, **e.to_json()}), 400
+    try:
+        if check.items is not None:
+            result = evaluate(check.code, schemas.to_builtins(check.items))
+        else:
+            discount = lookup(check.code)
+            result = {"code": discount.code, "type": discount.discount_type, "value": discount.value}
+    except DiscountError as e:
+        return jsonify({"valid": False, "reason": e.reason}), e.status_code
+    except Exception as e:
+        print(f"Discount check failed: {e}")
+        return jsonify({"valid": False, "reason": "Discount codes unavailable"}), 500
 
-    today = datetime.now().date()
+    return jsonify({"valid": True, **result})
 
-    start = starts_on.date() if hasattr(starts_on, "date") else starts_on
-    end = ends_on.date() if hasattr(ends_on, "date") else ends_on
 
-    if today < start or today > end:
-        return jsonify({"valid": False, "reason": "Code expired or inactive"}), 410
+@discounts_bp.route("/api/discounts/refresh", methods=["POST"])
+@manager_required
+def refresh_discounts():
+    """Reloads the codes now, e.g. right after adding one to discount_codes."""
+    try:
+        count = refresh()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"message": "Discount codes reloaded", "codes": count})
 
 
-    return jsonify({
-        "valid": True,
-        "code": code.upper(),
-        "type": dtype,
-        "value": float(value)
-    })
+background.periodic("discounts", DISCOUNT_REFRESH_INTERVAL, refresh)
@@ -0,0 +1,181 @@
+# server_flask/app/export.py
+#
+# CSV exports for the accountants: GET /api/export/orders and /api/export/items.
+#
+# Postgres writes the CSV itself with COPY (SELECT ...) TO STDOUT and the bytes
+# go straight to the response: copy_expert runs on a helper thread and hands
+# its chunks to the response generator through a small bounded queue, so memory
+# stays flat however many rows are exported (a slow client just slows COPY down).
+# ?gzip=1 (or Accept-Encoding: gzip) compresses the stream on the fly.
+
+import queue
+import threading
+import zlib
+from datetime import datetime, timedelta
+import psycopg2
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from .db import get_db
+from .decorators import manager_required
+
+export_bp = Blueprint('export', __name__, url_prefix='/api/export')
+
+# ordered_at is indexed (migrations/001_orders_ordered_at.sql), so a date range
+# is an index range scan; the dates are business days in Chicago time.
+EXPORT_QUERIES = {
+    "orders": """
+        SELECT order_id, time, day, month, year, total_price, tip, special_notes, payment_method, tax, ordered_at
+        FROM orders
+        WHERE ordered_at >= %(start)s AND ordered_at < %(end)s
+        ORDER BY order_id
+    """,
+    "items": """
+        SELECT i.*
+        FROM items i
+        JOIN orders o ON o.order_id = i.order_id
+        WHERE o.ordered_at >= %(start)s AND o.ordered_at < %(end)s
+        ORDER BY i.item_id
+    """,
+}
+
+_CHUNK_SIZE = 64 * 1024
+_CHUNK_QUEUE_SIZE = 16
+_DONE = object()
+
+
+class _QueueWriter:
+    """
+    File-like target for copy_expert. COPY writes one CSV row at a time, so rows
+    are gathered into ~_CHUNK_SIZE chunks before they go to the response generator
+    (one queue hand-off and one chunked-encoding frame per chunk, not per row).
+    """
+
+    def __init__(self):
+        self.chunks = queue.Queue(maxsize=_CHUNK_QUEUE_SIZE)
+        self.cancelled = threading.Event()
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= _CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if not self._buffer:
+            return
+        chunk = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._put(chunk)
+
+    def _put(self, chunk):
+        while True:
+            if self.cancelled.is_set():
+                # Raising here makes copy_expert abort the COPY
+                raise IOError("Export cancelled by the client")
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+
+def _parse_range():
+    """?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive, both optional)."""
+    start = request.args.get("from")
+    end = request.args.get("to")
+    start = datetime.strptime(start, "%Y-%m-%d").date() if start else datetime(2000, 1, 1).date()
+    end = datetime.strptime(end, "%Y-%m-%d").date() + timedelta(days=1) if end else datetime(9999, 1, 1).date()
+    if end <= start:
+        raise ValueError("'to' must not be before 'from'")
+    return start, end
+
+
+def _wants_gzip():
+    flag = request.args.get("gzip")
+    if flag is not None:
+        return flag.lower() in ("1", "true")
+    # Honours q-values: "gzip;q=0" means no gzip
+    return request.accept_encodings["gzip"] > 0
+
+
+@export_bp.route('/<string:table>', methods=['GET'])
+@manager_required
+def export_table(table):
+    """ Streams orders or items as CSV (with a header row), optionally for ?from=&to= dates. """
+    if table not in EXPORT_QUERIES:
+        return jsonify({"error": f"Unknown export '{table}', expected one of: {', '.join(EXPORT_QUERIES)}"}), 404
+    try:
+        start, end = _parse_range()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date range: {e}"}), 400
+    gzipped = _wants_gzip()
+
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    cur = conn.cursor()
+    # COPY can't take bind parameters, so the SELECT is rendered client-side (safely quoted)
+    select_sql = cur.mogrify(EXPORT_QUERIES[table], {"start": start, "end": end}).decode()
+    copy_sql = f"COPY ({select_sql}) TO STDOUT WITH (FORMAT CSV, HEADER)"
+
+    writer = _QueueWriter()
+
+    def run_copy():
+        try:
+            # Date boundaries (and the exported ordered_at values) are in Chicago time
+            cur.execute("SET LOCAL TIME ZONE 'America/Chicago';")
+            cur.copy_expert(copy_sql, writer, size=_CHUNK_SIZE)
+            writer.flush()
+        except Exception as e:
+            # Headers are already sent, so a failure just ends the download early
+            if not writer.cancelled.is_set():
+                print(f"Export of {table} failed: {e}")
+        finally:
+            writer.chunks.put(_DONE)
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzipped else None
+        thread = threading.Thread(target=run_copy, name=f"export-{table}", daemon=True)
+        thread.start()
+        try:
+            while True:
+                chunk = writer.chunks.get()
+                if chunk is _DONE:
+                    break
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                yield chunk
+            if compressor is not None:
+                yield compressor.flush()
+        finally:
+            writer.cancelled.set()
+            # Unblock the COPY thread if it's waiting on a full queue, then let it finish
+            while thread.is_alive():
+                try:
+                    writer.chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            try:
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error as e:
+                # A COPY aborted mid-stream can leave the connection unusable;
+                # closing it makes the pool discard it instead of reusing it
+                print(f"Discarding export connection: {e}")
+                conn.close()
+
+    filename = "_".join([table] + [request.args[k] for k in ("from", "to") if request.args.get(k)]) + ".csv"
+    response = Response(stream_with_context(generate()), mimetype="text/csv")
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+        response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,33 @@
+# server_flask/app/http_session.py
+#
+# Shared keep-alive HTTP sessions for the third-party APIs (weather, translate,
+# PayPal...). Reusing one requests.Session per API keeps TCP/TLS connections open
+# between calls instead of doing a fresh handshake every time, and every call
+# gets a timeout so a slow upstream can't hang a worker.
+
+import os
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) seconds
+HTTP_TIMEOUT = (
+    float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05)),
+    float(os.environ.get('HTTP_READ_TIMEOUT', 10)),
+)
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+
+
+class TimeoutSession(requests.Session):
+    """A requests.Session that applies HTTP_TIMEOUT unless the call passes its own timeout."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", HTTP_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+def make_session():
+    session = TimeoutSession()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,79 @@
+# server_flask/app/idempotency.py
+#
+# Idempotency-Key support for POST endpoints (migrations/004_idempotency_keys.sql).
+#
+# The key is claimed inside the same transaction as the write it protects:
+#   - first request: the key row is inserted, the write happens, the response is
+#     stored next to the key, and everything commits together
+#   - retry after commit: the INSERT conflicts and we replay the stored response
+#   - retry while the first is still running: the INSERT waits on the first
+#     transaction's row, then either replays its response or (if it rolled back) proceeds
+# so a retried request can never write twice. Expired keys are deleted by a
+# background sweep, and an expired key that wasn't swept yet can be claimed again.
+
+import hashlib
+import json
+import os
+from psycopg2.extras import Json
+from .db import pooled_connection
+from . import background
+
+IDEMPOTENCY_KEY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.environ.get('IDEMPOTENCY_SWEEP_INTERVAL', 600))
+MAX_KEY_LENGTH = 255
+
+
+class KeyReuseError(Exception):
+    """The key was already used for a request with a different body."""
+
+
+def fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def claim(cur, key, request_fingerprint):
+    """
+    Claims `key` for the current transaction.
+    Returns None if the caller should go ahead with the write,
+    or (status_code, body) of the earlier request to replay.
+    """
+    cur.execute("""
+        INSERT INTO idempotency_keys AS k (key, request_hash)
+        VALUES (%s, %s)
+        ON CONFLICT (key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, created_at = now(), status_code = NULL, response = NULL
+        WHERE k.created_at < now() - make_interval(secs => %s)
+        RETURNING key;
+    """, (key, request_fingerprint, IDEMPOTENCY_KEY_TTL_HOURS * 3600))
+    if cur.fetchone() is not None:
+        return None
+
+    cur.execute("SELECT request_hash, status_code, response FROM idempotency_keys WHERE key = %s;", (key,))
+    request_hash, status_code, response = cur.fetchone()
+    if request_hash != request_fingerprint:
+        raise KeyReuseError("Idempotency-Key was already used with a different request body")
+    return status_code, response
+
+
+def store_response(cur, key, status_code, body):
+    """Saves the response to replay for retries. Call before committing the write."""
+    cur.execute(
+        "UPDATE idempotency_keys SET status_code = %s, response = %s WHERE key = %s;",
+        (status_code, Json(body), key)
+    )
+
+
+def sweep():
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < now() - make_interval(secs => %s);",
+                (IDEMPOTENCY_KEY_TTL_HOURS * 3600,)
+            )
+            deleted = cur.rowcount
+        conn.commit()
+    if deleted:
+        print(f"Swept {deleted} expired idempotency keys")
+
+
+background.periodic("idempotency-sweep", IDEMPOTENCY_SWEEP_INTERVAL, sweep)
@@ -1,8 +1,11 @@
 # server_flask/app/inventory.py
 
 from flask import Blueprint, jsonify, request
-from .db import get_db_connection
+from .db import get_db
 from .decorators import manager_required, staff_required
+from .cache import notify
+from .inventory_ledger import CURRENT_INVENTORY_SQL, discard_pending
+from . import serialization, schemas
 
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/api')
 
@@ -12,19 +15,17 @@ inventory_bp = Blueprint('inventory', __name__, url_prefix='/api')
 @staff_required
 def get_inventory():
     """ Function to get all inventory items. """
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
         cur = conn.cursor()
         # This aliases numservings to numServings
-        cur.execute('SELECT inv_item_id, name, units_remaining, numservings AS "numServings" FROM inventory order by inv_item_id asc;')
-        rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        inventory = [dict(zip(columns, row)) for row in rows]  # Fixed variable name
+        # units_remaining includes usage still waiting in the ledger (see inventory_ledger.py)
+        cur.execute(f'SELECT inv_item_id, name, units_remaining, numservings AS "numServings" FROM ({CURRENT_INVENTORY_SQL}) AS inv order by inv_item_id asc;')
+        inventory = serialization.rows(cur)
         cur.close()
-        conn.close()
-        return jsonify(inventory)
+        return serialization.json_response(inventory)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -34,22 +35,13 @@ def get_inventory():
 @manager_required
 def create_inventory():
     """Create a new inventory item. Expects JSON: { name, units_remaining, numServings }"""
-    data = request.get_json() or {}
     try:
-        name = (data.get('name') or '').strip()
-        units_remaining = data.get('units_remaining')
-        numServings = data.get('numServings')
-
-        if not name:
-            return jsonify({"error": "name is required"}), 400
-        if units_remaining is None or numServings is None:
-            return jsonify({"error": "units_remaining and numServings are required"}), 400
-        if not isinstance(units_remaining, (int, float)) or not isinstance(numServings, (int, float)):
-            return jsonify({"error": "Stock levels must be numbers"}), 400
-    except Exception as e:
-        return jsonify({"error": "Invalid JSON data", "details": str(e)}), 400
+        item = schemas.decode(request.get_data(), schemas.NewInventoryItem)
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 400
+    name, units_remaining, numServings = item.name, item.units_remaining, item.numServings
 
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
 
@@ -66,6 +58,7 @@ def create_inventory():
             if row:
                 new_id = row[0]
             conn.commit()
+            notify("inventory")
         except Exception:
             # Fallback path for DBs without RETURNING (e.g., some MySQL versions)
             conn.rollback()
@@ -75,6 +68,7 @@ def create_inventory():
                 (name, units_remaining, numServings),
             )
             conn.commit()
+            notify("inventory")
             # Try lastrowid if available
             new_id = getattr(cur, 'lastrowid', None)
 
@@ -96,9 +90,8 @@ def create_inventory():
             'SELECT inv_item_id, name, units_remaining, numservings AS "numServings" FROM inventory WHERE inv_item_id = %s',
             (new_id,),
         )
-        columns = [desc[0] for desc in cur.description]
-        created = dict(zip(columns, cur.fetchone()))
-        return jsonify(created), 201
+        created = serialization.row(cur, cur.fetchone())
+        return serialization.json_response(created, 201)
 
     except Exception as e:
         conn.rollback()
@@ -108,38 +101,20 @@ def create_inventory():
             cur.close()
         except Exception:
             pass
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
 @inventory_bp.route('/inventory/<int:inv_item_id>', methods=['PUT'])
 @manager_required
 def update_inventory(inv_item_id):
     """ Function to update an inventory item's stock levels using its inv_item_id. """
-    data = request.get_json()
+    # We only care about stock levels in this route
     try:
-        # --- START FIX ---
-
-        # We only care about stock levels in this route
-        units_remaining = data.get('units_remaining')
-        numServings = data.get('numServings')
-
-        # Updated validation: Check for units_remaining and numServings
-        if units_remaining is None or numServings is None:
-            return jsonify({"error": "units_remaining and numServings are required"}), 400
+        stock = schemas.decode(request.get_data(), schemas.InventoryStock)
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 400
+    units_remaining, numServings = stock.units_remaining, stock.numServings
 
-        # Optional: Check if they are valid numbers (though parseFloat on frontend helps)
-        if not isinstance(units_remaining, (int, float)) or not isinstance(numServings, (int, float)):
-            return jsonify({"error": "Stock levels must be numbers"}), 400
-
-        # --- END FIX ---
-
-    except Exception as e:
-        return jsonify({"error": "Invalid JSON data", "details": str(e)}), 400
-
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
@@ -154,30 +129,29 @@ def update_inventory(inv_item_id):
         # --- END FIX 2 ---
 
         cur.execute(sql_query, values)
-        conn.commit()
-
         rowcount = cur.rowcount
 
         if rowcount == 0:
+            conn.rollback()
             cur.close()
-            conn.close()
             return jsonify({"error": "Inventory item not found"}), 404
 
+        # A manager-entered count replaces whatever usage hasn't been folded in yet
+        discard_pending(cur, inv_item_id)
+        conn.commit()
+        notify("inventory")
 
         cur.execute("SELECT * FROM inventory WHERE inv_item_id = %s", (inv_item_id,))
-        columns = [desc[0] for desc in cur.description]
-        updated_item = dict(zip(columns, cur.fetchone()))
+        updated_item = serialization.row(cur, cur.fetchone())
 
         cur.close()
-        conn.close()
 
-        return jsonify(updated_item)  # Return the full object
+        return serialization.json_response(updated_item)  # Return the full object
 
 
     except Exception as e:
         conn.rollback()
         cur.close()
-        conn.close()
         return jsonify({"error": str(e)}), 500
 
 
@@ -185,20 +159,23 @@ def update_inventory(inv_item_id):
 @manager_required
 def delete_inventory(inv_item_id):
     """ Function to delete an inventory item using its inv_item_id. """
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM inventory WHERE inv_item_id = %s", (inv_item_id,))
-        conn.commit()
-
         rowcount = cur.rowcount
-        cur.close()
-        conn.close()
 
         if rowcount == 0:
+            conn.rollback()
+            cur.close()
             return jsonify({"error": "Inventory item not found"}), 404
+
+        discard_pending(cur, inv_item_id)
+        conn.commit()
+        notify("inventory")
+        cur.close()
         return jsonify({"message": f"Inventory item {inv_item_id} deleted successfully"})
     except Exception as e:
         conn.rollback()
@@ -209,17 +186,14 @@ def delete_inventory(inv_item_id):
 @staff_required
 def get_ingredients():
     """ Function to get all ingredients. """
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
         cur = conn.cursor()
         cur.execute('SELECT * FROM ingredients;')
-        rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        ingredients = [dict(zip(columns, row)) for row in rows]
+        ingredients = serialization.rows(cur)
         cur.close()
-        conn.close()
-        return jsonify(ingredients)
+        return serialization.json_response(ingredients)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,99 @@
+# server_flask/app/inventory_ledger.py
+#
+# Append-only inventory consumption (migrations/006_inventory_ledger.sql).
+#
+# Every order used to UPDATE the same few inventory rows (cups, lids, straws),
+# so checkouts serialized on those row locks. Now an order only INSERTs ledger
+# rows, which never conflict, and a background job periodically folds the ledger
+# into inventory.units_remaining. Readers that need the live stock level use
+# CURRENT_INVENTORY_SQL: the compacted value minus what is still in the ledger.
+
+import os
+from psycopg2.extras import execute_values
+from .db import pooled_connection
+from . import background
+
+INVENTORY_COMPACT_INTERVAL = float(os.environ.get('INVENTORY_COMPACT_INTERVAL', 10))
+
+RECORD_USAGE_SQL = """
+    INSERT INTO inventory_ledger (inv_item_id, change)
+    SELECT inv.inv_item_id, usage.change
+    FROM (VALUES %s) AS usage (name, change)
+    JOIN inventory inv ON inv.name = usage.name
+"""
+
+# Live stock levels, usable as a subquery in place of the inventory table.
+# units_remaining stays a whole count: like COMPACT_SQL, only whole units of the
+# pending usage are taken off, so the value doesn't change when the ledger is folded.
+CURRENT_INVENTORY_SQL = """
+    SELECT inv.inv_item_id,
+           inv.name,
+           (inv.units_remaining - trunc(COALESCE(pending.change, 0)))::integer AS units_remaining,
+           inv.numservings
+    FROM inventory inv
+    LEFT JOIN (
+        SELECT inv_item_id, SUM(change) AS change
+        FROM inventory_ledger
+        GROUP BY inv_item_id
+    ) AS pending ON pending.inv_item_id = inv.inv_item_id
+"""
+
+# Moves the whole ledger into units_remaining in one statement. Only whole units
+# are folded; fractions (e.g. 0.3 of a bag of boba) go back into the ledger until
+# they add up, so nothing is lost to rounding. Rows inserted by orders that commit
+# while this runs aren't in the DELETE's snapshot and wait for the next run.
+COMPACT_SQL = """
+    WITH consumed AS (
+        DELETE FROM inventory_ledger
+        RETURNING inv_item_id, change
+    ),
+    totals AS (
+        SELECT inv_item_id, SUM(change) AS change, trunc(SUM(change)) AS whole
+        FROM consumed
+        GROUP BY inv_item_id
+    ),
+    carried AS (
+        INSERT INTO inventory_ledger (inv_item_id, change)
+        SELECT t.inv_item_id, t.change - t.whole
+        FROM totals t
+        JOIN inventory inv ON inv.inv_item_id = t.inv_item_id
+        WHERE t.change <> t.whole
+    ),
+    folded AS (
+        UPDATE inventory AS inv
+        SET units_remaining = inv.units_remaining - t.whole
+        FROM totals t
+        WHERE inv.inv_item_id = t.inv_item_id
+        AND t.whole <> 0
+    )
+    SELECT COUNT(*) FROM consumed;
+"""
+
+
+def record_usage(cur, inv_change):
+    """Records {inventory name: units used} in the ledger. Runs in the order's transaction and takes no row locks."""
+    rows = [(name, change) for name, change in inv_change.items() if change != 0]
+    if rows:
+        execute_values(cur, RECORD_USAGE_SQL, rows, page_size=len(rows))
+
+
+def discard_pending(cur, inv_item_id):
+    """Drops unfolded usage for an item whose stock level is being set by hand (a recount)."""
+    cur.execute("DELETE FROM inventory_ledger WHERE inv_item_id = %s;", (inv_item_id,))
+
+
+def compact():
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            # One compactor at a time across all workers; the others just skip this round
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('inventory_ledger_compact'));")
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return 0
+            cur.execute(COMPACT_SQL)
+            folded = cur.fetchone()[0]
+        conn.commit()
+    return folded
+
+
+background.periodic("inventory-ledger-compact", INVENTORY_COMPACT_INTERVAL, compact)
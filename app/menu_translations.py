@@ -0,0 +1,109 @@
+# server_flask/app/menu_translations.py
+#
+# Pre-translated menu (migrations/008_product_translations.sql).
+#
+# The text fields of every product are translated into each MENU_LANGUAGES
+# language ahead of time and stored in product_translations, so
+# GET /api/products?lang=es is served from the catalog cache like the English
+# menu, with no call to Google on the request path.
+#
+# Translations are refreshed right after add_product/update_product (on a
+# background thread, so a slow or failing Google call never fails the write),
+# and a periodic warm-up job fills in anything missing or out of date.
+
+import hashlib
+import json
+import os
+import threading
+from psycopg2.extras import Json, execute_values
+from .db import pooled_connection
+from .cache import notify
+from . import background
+from .translate import translate_texts
+
+MENU_LANGUAGES = [lang.strip() for lang in os.environ.get('MENU_LANGUAGES', 'es').split(',') if lang.strip()]
+MENU_TRANSLATION_INTERVAL = float(os.environ.get('MENU_TRANSLATION_INTERVAL', 3600))
+
+TRANSLATED_FIELDS = ("product_name", "category", "flavor", "flavor_2", "flavor_3")
+
+_refresh_lock = threading.Lock()
+
+
+def _source_hash(product):
+    text = json.dumps([product.get(field) for field in TRANSLATED_FIELDS])
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def refresh(product_ids=None):
+    """
+    Translates the products whose stored translations are missing or stale
+    (all products, or just `product_ids`). Returns the number of rows written.
+    """
+    if not MENU_LANGUAGES:
+        return 0
+    with _refresh_lock:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT product_id, {', '.join(TRANSLATED_FIELDS)} FROM products"
+                    + (" WHERE product_id = ANY(%s);" if product_ids is not None else ";"),
+                    (list(product_ids),) if product_ids is not None else None
+                )
+                products = [dict(zip(("product_id",) + TRANSLATED_FIELDS, row)) for row in cur.fetchall()]
+                cur.execute(
+                    "SELECT product_id, language, source_hash FROM product_translations WHERE language = ANY(%s);",
+                    (MENU_LANGUAGES,)
+                )
+                stored = {(product_id, language): source_hash for product_id, language, source_hash in cur.fetchall()}
+            conn.rollback()
+
+        rows = []
+        for language in MENU_LANGUAGES:
+            stale = [p for p in products if stored.get((p["product_id"], language)) != _source_hash(p)]
+            texts = sorted({str(p[field]) for p in stale for field in TRANSLATED_FIELDS if p[field]})
+            if not texts:
+                continue
+            # One batched call; texts translated before come from the translation cache
+            translated = dict(zip(texts, translate_texts(texts, language)[0]))
+            for p in stale:
+                fields = {field: translated[str(p[field])] for field in TRANSLATED_FIELDS if p[field]}
+                rows.append((p["product_id"], language, Json(fields), _source_hash(p)))
+
+        if not rows:
+            return 0
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(cur, """
+                    INSERT INTO product_translations (product_id, language, fields, source_hash)
+                    VALUES %s
+                    ON CONFLICT (product_id, language) DO UPDATE
+                    SET fields = EXCLUDED.fields, source_hash = EXCLUDED.source_hash, translated_at = now()
+                """, rows)
+            conn.commit()
+    # Only the served catalog shows translations; recipes and dashboard stats don't change
+    notify("product_translations")
+    return len(rows)
+
+
+def refresh_async(product_ids):
+    """Runs refresh() for a just-written product without holding up the request."""
+    def run():
+        try:
+            refresh(product_ids)
+        except Exception as e:
+            print(f"Could not translate products {product_ids}: {e}")
+
+    threading.Thread(target=run, name="menu-translations", daemon=True).start()
+
+
+def load(cur, language):
+    """{product_id: translated fields} for one language."""
+    cur.execute("SELECT product_id, fields FROM product_translations WHERE language = %s;", (language,))
+    return dict(cur.fetchall())
+
+
+def delete(cur, product_id):
+    cur.execute("DELETE FROM product_translations WHERE product_id = %s;", (product_id,))
+
+
+background.periodic("menu-translations", MENU_TRANSLATION_INTERVAL, refresh)
@@ -0,0 +1,310 @@
+# server_flask/app/order_journal.py
+#
+# Write-behind mode for POST /api/orders (ORDER_WRITE_MODE=journal).
+#
+# add_order validates the order, appends it to a local SQLite journal (WAL,
+# synchronous=FULL, so it survives a crash once the INSERT returns) and answers
+# 202 with a provisional id. A background flusher then drains the journal into
+# Postgres in batches, oldest first, using the same bulk path as
+# POST /api/orders/batch. The register never waits on Postgres.
+#
+# Exactly once: every journal entry is written to Postgres together with an
+# idempotency_keys row (the client's Idempotency-Key, or "journal:<instance>:<id>"),
+# in the same transaction. If we crash after the Postgres commit but before the
+# journal is marked, the next flush finds the key and just records its order_id.
+#
+# Retry: connection problems leave the batch pending for the next tick. Any
+# other error splits the batch so one bad order can't block the ones behind it;
+# an order that fails on its own is marked 'failed' with the error.
+#
+# The journal file is shared by every worker on the machine; a file lock makes
+# sure only one of them flushes at a time.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import psycopg2
+from psycopg2.extras import Json, execute_values
+from .db import pooled_connection, PoolTimeout
+from .cache import notify
+from . import background, idempotency
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: one process, the thread lock is enough
+    fcntl = None
+
+ORDER_WRITE_MODE = os.environ.get('ORDER_WRITE_MODE', 'sync')
+ENABLED = ORDER_WRITE_MODE == 'journal'
+ORDER_JOURNAL_PATH = os.environ.get(
+    'ORDER_JOURNAL_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'order_journal.db')
+)
+ORDER_FLUSH_INTERVAL = float(os.environ.get('ORDER_FLUSH_INTERVAL', 0.5))
+ORDER_FLUSH_BATCH = int(os.environ.get('ORDER_FLUSH_BATCH', 500))
+ORDER_JOURNAL_RETENTION_HOURS = float(os.environ.get('ORDER_JOURNAL_RETENTION_HOURS', 24))
+
+# Errors that mean "Postgres is unreachable right now", not "this order is bad"
+RETRYABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout)
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS journal (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        client_key TEXT UNIQUE,
+        request_hash TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',   -- pending | written | failed
+        order_id INTEGER,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS journal_pending_idx ON journal (id) WHERE status = 'pending';
+"""
+
+_schema_ready = False
+_instance = None
+_flush_lock = threading.Lock()
+
+
+def _connect():
+    """Opens the journal. SQLite connections can't be shared across threads, so each caller opens its own."""
+    global _schema_ready, _instance
+    conn = sqlite3.connect(ORDER_JOURNAL_PATH, timeout=10, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=FULL;")
+    if not _schema_ready:
+        conn.executescript(SCHEMA_SQL)
+        # A random id per journal file, so journal keys never collide with those of another file
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('instance', ?);", (uuid.uuid4().hex[:8],))
+        _instance = conn.execute("SELECT value FROM meta WHERE key = 'instance';").fetchone()[0]
+        _schema_ready = True
+    return conn
+
+
+def _provisional_id(entry_id):
+    return f"{_instance}-{entry_id}"
+
+
+def _as_json(row):
+    return {
+        "provisional_id": _provisional_id(row["id"]),
+        "status": row["status"],
+        "order_id": row["order_id"],
+        "error": row["error"],
+        "attempts": row["attempts"],
+    }
+
+
+def find(client_key, request_hash):
+    """
+    The journal entry a client_key already made, or None.
+    Raises idempotency.KeyReuseError if the key was used for a different order.
+    """
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM journal WHERE client_key = ?;", (client_key,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    if row["request_hash"] != request_hash:
+        raise idempotency.KeyReuseError("Idempotency-Key was already used with a different request body")
+    return _as_json(row)
+
+
+def enqueue(data, client_key=None, request_hash=None):
+    """
+    Appends a validated order to the journal. Returns (entry, replayed):
+    a retry with the same client_key gets the existing entry back instead of a new one.
+    request_hash defaults to the fingerprint of `data`.
+    Raises idempotency.KeyReuseError if the key was used for a different order.
+    """
+    request_hash = request_hash or idempotency.fingerprint(data)
+    conn = _connect()
+    try:
+        try:
+            cursor = conn.execute(
+                "INSERT INTO journal (client_key, request_hash, payload, created_at) VALUES (?, ?, ?, ?);",
+                (client_key, request_hash, json.dumps(data), time.time())
+            )
+            row = conn.execute("SELECT * FROM journal WHERE id = ?;", (cursor.lastrowid,)).fetchone()
+            return _as_json(row), False
+        except sqlite3.IntegrityError:
+            row = conn.execute("SELECT * FROM journal WHERE client_key = ?;", (client_key,)).fetchone()
+            if row["request_hash"] != request_hash:
+                raise idempotency.KeyReuseError("Idempotency-Key was already used with a different request body")
+            return _as_json(row), True
+    finally:
+        conn.close()
+
+
+def status(provisional_id):
+    """Returns the journal entry for a provisional id, or None if it's unknown (or already pruned)."""
+    instance, _, entry_id = str(provisional_id).rpartition("-")
+    conn = _connect()
+    try:
+        if instance != _instance or not entry_id.isdigit():
+            return None
+        row = conn.execute("SELECT * FROM journal WHERE id = ?;", (int(entry_id),)).fetchone()
+        return _as_json(row) if row else None
+    finally:
+        conn.close()
+
+
+def pending_count():
+    conn = _connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM journal WHERE status = 'pending';").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _key(row):
+    return row["client_key"] or f"journal:{_instance}:{row['id']}"
+
+
+def _write(rows):
+    """
+    Writes journal rows to Postgres in ONE transaction.
+    Returns {journal id: order_id or KeyReuseError}; raises if the transaction failed.
+    """
+    from . import orders  # orders imports this module
+
+    keys = {row["id"]: _key(row) for row in rows}
+    results = {}
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            # Entries that already made it to Postgres (crash before the journal was marked,
+            # or a synchronous request that used the same Idempotency-Key)
+            cur.execute(
+                "SELECT key, request_hash, response FROM idempotency_keys WHERE key = ANY(%s) AND status_code IS NOT NULL;",
+                (list(keys.values()),)
+            )
+            existing = {key: (request_hash, response) for key, request_hash, response in cur.fetchall()}
+
+            todo = []
+            for row in rows:
+                if keys[row["id"]] not in existing:
+                    todo.append(row)
+                    continue
+                request_hash, response = existing[keys[row["id"]]]
+                if request_hash != row["request_hash"]:
+                    results[row["id"]] = idempotency.KeyReuseError("Idempotency-Key was already used with a different request body")
+                else:
+                    results[row["id"]] = (response or {}).get("order_id")
+
+            if todo:
+                payloads = [json.loads(row["payload"]) for row in todo]
+                order_ids = orders.write_orders(cur, [(p, orders._ordered_at(p)) for p in payloads])
+                key_rows = []
+                for row, order_id in zip(todo, order_ids):
+                    results[row["id"]] = order_id
+                    key_rows.append((
+                        keys[row["id"]], row["request_hash"], 201,
+                        Json({"message": "Order added successfully", "order_id": order_id})
+                    ))
+                execute_values(
+                    cur,
+                    "INSERT INTO idempotency_keys (key, request_hash, status_code, response) VALUES %s",
+                    key_rows, page_size=len(key_rows)
+                )
+        conn.commit()
+    if todo:
+        notify("orders")
+    return results
+
+
+def _mark(journal, results):
+    now = time.time()
+    with journal:
+        journal.execute("BEGIN IMMEDIATE;")
+        for entry_id, result in results.items():
+            if isinstance(result, Exception):
+                journal.execute(
+                    "UPDATE journal SET status = 'failed', error = ?, attempts = attempts + 1, finished_at = ? WHERE id = ?;",
+                    (str(result), now, entry_id)
+                )
+            else:
+                journal.execute(
+                    "UPDATE journal SET status = 'written', order_id = ?, error = NULL, attempts = attempts + 1, finished_at = ? WHERE id = ?;",
+                    (result, now, entry_id)
+                )
+
+
+def _flush_rows(journal, rows):
+    """Flushes rows (oldest first). Returns False if Postgres is unreachable and flushing should stop."""
+    try:
+        _mark(journal, _write(rows))
+        return True
+    except RETRYABLE_ERRORS as e:
+        journal.execute(
+            f"UPDATE journal SET attempts = attempts + 1, error = ? WHERE id IN ({','.join('?' * len(rows))});",
+            [str(e)] + [row["id"] for row in rows]
+        )
+        print(f"Order journal flush postponed: {e}")
+        return False
+    except Exception as e:
+        if len(rows) == 1:
+            _mark(journal, {rows[0]["id"]: e})
+            print(f"Order journal entry {rows[0]['id']} failed: {e}")
+            return True
+        # Split the batch to find the bad order(s); the rest still go in, in order
+        middle = len(rows) // 2
+        return _flush_rows(journal, rows[:middle]) and _flush_rows(journal, rows[middle:])
+
+
+def _prune(journal):
+    journal.execute(
+        "DELETE FROM journal WHERE status != 'pending' AND finished_at < ?;",
+        (time.time() - ORDER_JOURNAL_RETENTION_HOURS * 3600,)
+    )
+
+
+def flush():
+    """Drains the journal into Postgres. Returns the number of entries written or failed."""
+    if not _flush_lock.acquire(blocking=False):
+        return 0
+    lock_file = None
+    try:
+        if fcntl is not None:
+            lock_file = open(ORDER_JOURNAL_PATH + ".lock", "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # another worker is flushing
+
+        journal = _connect()
+        try:
+            done = 0
+            while True:
+                rows = journal.execute(
+                    "SELECT * FROM journal WHERE status = 'pending' ORDER BY id LIMIT ?;",
+                    (ORDER_FLUSH_BATCH,)
+                ).fetchall()
+                if not rows:
+                    break
+                if not _flush_rows(journal, rows):
+                    break
+                done += len(rows)
+            _prune(journal)
+            return done
+        finally:
+            journal.close()
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+        _flush_lock.release()
+
+
+if ENABLED:
+    background.periodic("order-journal-flush", ORDER_FLUSH_INTERVAL, flush)
@@ -0,0 +1,63 @@
+# server_flask/app/order_totals.py
+#
+# Deferred counters for new orders (migrations/011_order_totals_pending.sql).
+#
+# The X report's running totals (shift_totals.py) and the dashboard rollups
+# (rollups.py) are a handful of rows per day, so updating them from every
+# checkout made concurrent checkouts wait on each other's row locks. An order
+# now only appends its id to order_totals_pending, which never conflicts, and a
+# background job folds the queued orders into both sets of tables every
+# ORDER_TOTALS_FOLD_INTERVAL seconds, like the inventory ledger.
+#
+# The X report adds the still-queued orders when it reads (so it is always
+# exact); the Z close and the reconcile endpoint fold the queue first. The
+# dashboard rollups can lag new orders by up to one fold interval.
+
+import os
+from .db import pooled_connection
+from .cache import notify
+from . import background, shift_totals, rollups
+
+ORDER_TOTALS_FOLD_INTERVAL = float(os.environ.get('ORDER_TOTALS_FOLD_INTERVAL', 5))
+
+
+def record_orders(cur, order_ids):
+    """Queues new orders for the running totals and rollups. Runs in the orders' transaction."""
+    cur.execute(
+        "INSERT INTO order_totals_pending (order_id) SELECT unnest(%s::integer[]);",
+        (list(order_ids),)
+    )
+
+
+def fold(cur):
+    """
+    Moves every queued order into shift_totals and the rollups, in the caller's
+    transaction. Returns the number of orders folded.
+    """
+    # Z close takes lastzreport FOR UPDATE, so a fold and a close never interleave
+    cur.execute("SELECT 1 FROM lastzreport FOR KEY SHARE;")
+    cur.execute("DELETE FROM order_totals_pending RETURNING order_id;")
+    order_ids = [row[0] for row in cur.fetchall()]
+    if order_ids:
+        shift_totals.record_orders(cur, order_ids)
+        rollups.record_orders(cur, order_ids)
+    return len(order_ids)
+
+
+def compact():
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            # One folder at a time across all workers; the others just skip this round
+            cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('order_totals_fold'));")
+            if not cur.fetchone()[0]:
+                conn.rollback()
+                return 0
+            folded = fold(cur)
+        conn.commit()
+    if folded:
+        # The dashboard reads the rollups, which only changed now
+        notify("orders")
+    return folded
+
+
+background.periodic("order-totals-fold", ORDER_TOTALS_FOLD_INTERVAL, compact)
@@ -1,126 +1,269 @@
 # server_flask/app/orders.py
 
+import base64
+import csv
+import io
+import os
+from datetime import date, datetime
+import pytz
 from flask import Blueprint, jsonify, request
-from .db import get_db_connection
+from psycopg2.extras import execute_values
+from .db import get_db
 from .decorators import staff_required
+from . import order_totals, idempotency, order_journal, recipes, inventory_ledger, serialization, schemas, discounts
+from .cache import notify
 
 # We use a general prefix since this file handles /orders AND /items
 orders_bp = Blueprint('orders', __name__, url_prefix='/api')
 
 
+def _encode_cursor(order_id):
+    return base64.urlsafe_b64encode(f"o:{order_id}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    """Returns the order_id inside a cursor made by _encode_cursor, or raises ValueError."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not raw.startswith("o:"):
+        raise ValueError("Invalid cursor")
+    return int(raw[2:])
+
+
+def _count_orders(cur, mode):
+    """ mode: 'exact' (COUNT(*)), 'approx' (planner statistics) or 'none'. """
+    if mode == "none":
+        return None
+    if mode == "approx":
+        # reltuples is kept up to date by (auto)vacuum/analyze; it is -1 if the table was never analyzed
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'orders'::regclass;")
+        row = cur.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+    cur.execute("SELECT COUNT(*) FROM orders;")
+    return cur.fetchone()[0]
+
+
 @orders_bp.route('/orders', methods=['GET'], strict_slashes=False)
 @staff_required
 def get_orders():
-    """Function to get paginated orders."""
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({"error": "Database connection failed"}), 500
-
+    """
+    Function to get paginated orders, newest first.
+    Two ways to page:
+      - ?limit=&offset=        (cost grows with the offset)
+      - ?limit=&after=<cursor> (older orders) or ?before=<cursor> (newer orders),
+        using next_cursor/prev_cursor from the previous page; constant cost per page.
+    ?count=exact|approx|none picks how "count" is computed
+    (default: exact for offset paging, approx for cursor paging).
+    ?stream=ndjson|json streams the page's rows instead (no count or cursors),
+    so limit can be large, or 0 for every order.
+    """
     try:
         limit = int(request.args.get("limit", 50))
         offset = int(request.args.get("offset", 0))
+        after = request.args.get("after")
+        before = request.args.get("before")
+        after_id = _decode_cursor(after) if after else None
+        before_id = _decode_cursor(before) if before else None
+        stream = serialization.stream_format()
+        fetch_size = serialization.fetch_size()
+    except ValueError as e:
+        return jsonify({"error": f"Invalid pagination parameters: {e}"}), 400
+
+    if stream:
+        return _stream_orders(stream, fetch_size, limit, offset, after_id, before_id)
+
+    use_cursor = after_id is not None or before_id is not None
+    count_mode = request.args.get("count", "approx" if use_cursor else "exact")
+    if count_mode not in ("exact", "approx", "none"):
+        return jsonify({"error": "count must be one of exact, approx, none"}), 400
+
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "Database connection failed"}), 500
 
+    try:
         cur = conn.cursor()
-        # 1️⃣ Get paginated data
-        cur.execute(
-            "SELECT * FROM orders ORDER BY order_id DESC LIMIT %s OFFSET %s;",
-            (limit, offset)
-        )
+        # 1️⃣ Get paginated data (one extra row tells us whether there is another page)
+        if after_id is not None:
+            cur.execute(
+                "SELECT * FROM orders WHERE order_id < %s ORDER BY order_id DESC LIMIT %s;",
+                (after_id, limit + 1)
+            )
+        elif before_id is not None:
+            cur.execute(
+                "SELECT * FROM orders WHERE order_id > %s ORDER BY order_id ASC LIMIT %s;",
+                (before_id, limit + 1)
+            )
+        else:
+            cur.execute(
+                "SELECT * FROM orders ORDER BY order_id DESC LIMIT %s OFFSET %s;",
+                (limit + 1, offset)
+            )
         rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        orders = [dict(zip(columns, row)) for row in rows]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if before_id is not None:
+            rows.reverse()
+        id_index = serialization.columns(cur).index("order_id")
+        ids = [row[id_index] for row in rows]
+        orders = serialization.rows(cur, rows)
 
         # 2️⃣ Get total count of all orders (for pagination)
-        cur.execute("SELECT COUNT(*) FROM orders;")
-        total_count = cur.fetchone()[0]
+        total_count = _count_orders(cur, count_mode)
 
         cur.close()
-        conn.close()
 
-        return jsonify({
+        older_exist = has_more if before_id is None else bool(ids)
+        newer_exist = has_more if before_id is not None else bool(ids) and (after_id is not None or offset > 0)
+
+        return serialization.json_response({
             "orders": orders,
             "count": total_count,
+            "count_is_estimate": count_mode == "approx",
             "limit": limit,
-            "offset": offset
+            "offset": offset,
+            "next_cursor": _encode_cursor(ids[-1]) if ids and older_exist else None,
+            "prev_cursor": _encode_cursor(ids[0]) if ids and newer_exist else None
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# calculate the change in inventory for an Item in an Order
-def calc_inv_usage(item):
-    single_inv_change = {
-        "Small Cups": 0,
-        "Medium Cups": 0,
-        "Large Cups": 0,
-        "Lids": 0,
-        "Straws": 0,
-    }
-
-    size = item.get("size")
-    if size == "Small":
-        single_inv_change["Small Cups"] += 1
-    elif size == "Medium":
-        single_inv_change["Medium Cups"] += 1
-    elif size == "Large" or size == "Bucee's":
-        single_inv_change["Large Cups"] += 1
-        
-    single_inv_change["Lids"] += 1
-    single_inv_change["Straws"] += 1
-
-    return single_inv_change
+def _stream_orders(fmt, fetch_size, limit, offset, after_id, before_id):
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "Database connection failed"}), 500
 
-@orders_bp.route('/orders', methods=['POST'], strict_slashes=False)
-def add_order():
-    """ Function to add a new order. This is a TRANSACTION. """
-    data = request.get_json()
-    order_details = {
+    where, params = "TRUE", []
+    if after_id is not None:
+        where, params = "order_id < %s", [after_id]
+    elif before_id is not None:
+        # the newest `limit` orders before the cursor, still sent newest first
+        where = "order_id IN (SELECT order_id FROM orders WHERE order_id > %s ORDER BY order_id ASC LIMIT %s)"
+        params = [before_id, limit or None]
+    sql = f"SELECT * FROM orders WHERE {where} ORDER BY order_id DESC LIMIT %s OFFSET %s"
+    params += [limit or None, offset if after_id is None and before_id is None else 0]
+    return serialization.stream_rows(conn, sql, params, fmt, fetch_size)
+
+
+ITEMS_INSERT_SQL = """
+    INSERT INTO items (order_id, product_id, size, sugar_level, ice_level, toppings, price, quantity)
+    VALUES %s
+"""
+
+def _order_details(data):
+    return {
         "time": data.get('time'), "day": data.get('day'), "month": data.get('month'),
         "year": data.get('year'), "total_price": data.get('total_price'), "tip": data.get('tip'),
-        "special_notes": data.get('special_notes'), "payment_method": data.get('payment_method'), "tax": data.get('tax')
+        "special_notes": data.get('special_notes'), "payment_method": data.get('payment_method'), "tax": data.get('tax'),
+        "discount_code": data.get('discount_code'), "discount_amount": data.get('discount_amount')
     }
-    items_list = data.get('items')
 
-    # Basic validation
-    if not all(v is not None for v in order_details.values()) or not items_list:
-         # A more robust check for required fields
-        if not data.get('time') or not data.get('day') or not data.get('month') or not data.get('year') or data.get('total_price') is None or not data.get('payment_method'):
-             return jsonify({"error": "Missing required order details"}), 400
-        if not items_list:
-            return jsonify({"error": "Order must contain at least one item"}), 400
+
+def _check_discount(data, day=None):
+    """The discount_amount for an order with a discount_code, or InvalidRequest if the code or total is wrong."""
+    data['discount_code'] = data['discount_code'].strip().upper()
+    try:
+        return discounts.check_order_total(data, day)
+    except discounts.DiscountError as e:
+        raise schemas.InvalidRequest(e.reason, "$.discount_code")
+    except ValueError as e:
+        raise schemas.InvalidRequest(str(e), "$.total_price")
 
 
-    conn = get_db_connection()
+def _apply_discount(data):
+    """
+    Sets data['discount_amount'] for an order with a discount_code.
+    Returns None, or the error response if the code or total is wrong.
+    """
+    if not data.get('discount_code'):
+        return None
+    # The discount is recomputed here, never taken from the client
+    try:
+        data['discount_amount'] = _check_discount(data)
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 422
+    except Exception as e:
+        print(f"Discount check failed: {e}")
+        return jsonify({"error": "Discount codes unavailable"}), 503
+    return None
+
+
+@orders_bp.route('/orders', methods=['POST'], strict_slashes=False)
+def add_order():
+    """ Function to add a new order. This is a TRANSACTION. """
+    # Validate the whole payload (items included) before taking a connection
+    try:
+        order = schemas.decode(request.get_data(), schemas.Order, strict=False)
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 400
+    data = schemas.to_builtins(order)
+
+    # Optional: lets a kiosk safely retry a request whose response got lost.
+    # The key is checked against the order as the client sent it, before the
+    # discount is worked out, so a retry replays the first response even if
+    # the code expired or changed in between.
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= idempotency.MAX_KEY_LENGTH:
+        return jsonify({"error": "Invalid Idempotency-Key header"}), 400
+    request_hash = idempotency.fingerprint(data)
+
+    if order_journal.ENABLED:
+        return _journal_order(data, idempotency_key, request_hash)
+
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
         cur = conn.cursor()
+
+        if idempotency_key:
+            try:
+                previous = idempotency.claim(cur, idempotency_key, request_hash)
+            except idempotency.KeyReuseError as e:
+                conn.rollback()
+                return jsonify({"error": str(e)}), 422
+            if previous is not None:
+                # Already processed: replay the stored response, write nothing
+                conn.rollback()
+                status_code, body = previous
+                response = jsonify(body)
+                response.headers["Idempotent-Replayed"] = "true"
+                return response, status_code
+
+        # Only a first execution gets here; an error releases the key (rollback)
+        error = _apply_discount(data)
+        if error is not None:
+            conn.rollback()
+            return error
+        order_details = _order_details(data)
+        items_list = data['items']
+
         order_sql = """
-            INSERT INTO orders (time, day, month, year, total_price, tip, special_notes, payment_method, tax)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING order_id
+            INSERT INTO orders (time, day, month, year, total_price, tip, special_notes, payment_method, tax,
+                                discount_code, discount_amount, ordered_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                    (make_date(%s, %s, %s) + %s::time) AT TIME ZONE 'America/Chicago')
+            RETURNING order_id
         """
         # Use .get() for optional fields like tip and special_notes
         order_values = (
             order_details["time"], order_details["day"], order_details["month"],
             order_details["year"], order_details["total_price"], order_details.get("tip"),
-            order_details.get("special_notes"), order_details["payment_method"], order_details["tax"]
+            order_details.get("special_notes"), order_details["payment_method"], order_details["tax"],
+            order_details["discount_code"], order_details["discount_amount"],
+            # ordered_at: the same local wall-clock time as a real timestamp
+            order_details["year"], order_details["month"], order_details["day"], order_details["time"]
         )
         cur.execute(order_sql, order_values)
         new_order_id = cur.fetchone()[0]
 
-        total_inv_change = {
-            "Small Cups": 0,
-            "Medium Cups": 0,
-            "Large Cups": 0,
-            "Lids": 0,
-            "Straws": 0,
-        }
-
-        item_sql = """
-            INSERT INTO items (order_id, product_id, size, sugar_level, ice_level, toppings, price, quantity)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """
+        # All items in one multi-row INSERT
+        item_rows = []
         for item in items_list:
-            item_values = (
+            item_rows.append((
                 new_order_id,
                 item.get('product_id'),
                 item.get('size'),
@@ -129,24 +272,193 @@ def add_order():
                 item.get('toppings'),
                 item.get('price'),
                 item.get('quantity', 1)
-            )
-            cur.execute(item_sql, item_values)
+            ))
+
+        execute_values(cur, ITEMS_INSERT_SQL, item_rows, page_size=len(item_rows))
+
+        # Queue the order for the X report's running totals and the dashboard
+        # rollups; appending takes no shared row locks (see order_totals.py)
+        order_totals.record_orders(cur, [new_order_id])
+
+        # Cups, lids, tea, milk, toppings... from the recipes (see recipes.py)
+        inventory_ledger.record_usage(cur, recipes.order_usage(cur, items_list))
+
+        result = {"message": "Order added successfully", "order_id": new_order_id}
+        if idempotency_key:
+            idempotency.store_response(cur, idempotency_key, 201, result)
+
+        conn.commit()
+        notify("orders")
+        cur.close()
+        return jsonify(result), 201
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": f"Transaction failed: {str(e)}"}), 500
+
+def _journal_order(data, idempotency_key, request_hash):
+    """Write-behind mode: the order goes to the local journal and Postgres gets it a moment later."""
+    try:
+        entry = order_journal.find(idempotency_key, request_hash) if idempotency_key else None
+        replayed = entry is not None
+        if entry is None:
+            error = _apply_discount(data)
+            if error is not None:
+                return error
+            entry, replayed = order_journal.enqueue(data, idempotency_key, request_hash)
+    except idempotency.KeyReuseError as e:
+        return jsonify({"error": str(e)}), 422
+    except Exception as e:
+        return jsonify({"error": f"Could not queue order: {str(e)}"}), 500
+
+    response = jsonify({"message": "Order queued", **entry})
+    response.headers["Location"] = f"/api/orders/queued/{entry['provisional_id']}"
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response, 202
+
+
+@orders_bp.route('/orders/queued/<provisional_id>', methods=['GET'], strict_slashes=False)
+def get_queued_order(provisional_id):
+    """
+    Status of an order accepted in write-behind mode (202 from POST /api/orders).
+    status is 'pending', 'written' (order_id is set) or 'failed' (error is set).
+    """
+    try:
+        entry = order_journal.status(provisional_id)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if entry is None:
+        return jsonify({"error": "Queued order not found"}), 404
+    return jsonify(entry)
+
+
+ORDER_BATCH_MAX = int(os.environ.get('ORDER_BATCH_MAX', 5000))
+
+ORDER_COPY_COLUMNS = ("order_id", "time", "day", "month", "year", "total_price", "tip",
+                      "special_notes", "payment_method", "tax", "discount_code", "discount_amount", "ordered_at")
+ITEM_COPY_COLUMNS = ("order_id", "product_id", "size", "sugar_level", "ice_level", "toppings", "price", "quantity")
+
+
+def _ordered_at(data):
+    """The order's local wall-clock time as an aware datetime (what ordered_at stores)."""
+    t = schemas.parse_time(data['time'])
+    local = datetime.combine(date(int(data['year']), int(data['month']), int(data['day'])), t)
+    return pytz.timezone("America/Chicago").localize(local)
+
+
+def _copy_rows(cur, table, columns, rows):
+    """Bulk-loads rows with COPY ... FROM STDIN (NULL written as \\N)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(["\\N" if v is None else v for v in row])
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT CSV, NULL '\\N')",
+        buf
+    )
+
+
+def write_orders(cur, orders):
+    """
+    Writes many validated orders in the caller's transaction: ids are reserved up
+    front so orders and items can both be COPY'd, then the orders are queued for the
+    running totals and rollups and their inventory usage is recorded once for the whole set.
+    orders: [(add_order payload, ordered_at), ...]. Returns the new order_ids, in order.
+    """
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence('orders', 'order_id')) FROM generate_series(1, %s);",
+        (len(orders),)
+    )
+    order_ids = [row[0] for row in cur.fetchall()]
+
+    order_rows = []
+    item_rows = []
+    for order_id, (order, ordered_at) in zip(order_ids, orders):
+        details = _order_details(order)
+        order_rows.append((
+            order_id, details["time"], details["day"], details["month"], details["year"],
+            details["total_price"], details["tip"], details["special_notes"],
+            details["payment_method"], details["tax"],
+            details["discount_code"], details["discount_amount"], ordered_at.isoformat()
+        ))
+        for item in order['items']:
+            item_rows.append((
+                order_id,
+                item.get('product_id'),
+                item.get('size'),
+                item.get('sugar_level'),
+                item.get('ice_level'),
+                item.get('toppings'),
+                item.get('price'),
+                item.get('quantity', 1)
+            ))
+
+    _copy_rows(cur, "orders", ORDER_COPY_COLUMNS, order_rows)
+    _copy_rows(cur, "items", ITEM_COPY_COLUMNS, item_rows)
 
-            single_inv_change = calc_inv_usage(item) #total up all inventory changes for this one order
-            for key in total_inv_change:
-                total_inv_change[key] += single_inv_change[key]
+    order_totals.record_orders(cur, order_ids)
+    inventory_ledger.record_usage(cur, recipes.orders_usage(cur, [order for order, _ in orders]))
+    return order_ids
 
-        for inv_item, change in total_inv_change.items():
-            if change != 0:
-                inv_sql = """
-                    UPDATE inventory SET units_remaining = units_remaining - %s WHERE name = %s
-                """
-                cur.execute(inv_sql, (change, inv_item))
+
+@orders_bp.route('/orders/batch', methods=['POST'], strict_slashes=False)
+def add_orders_batch():
+    """
+    Bulk version of add_order for kiosks replaying orders queued while offline.
+    Body: {"orders": [<add_order payload>, ...]} (or just the list).
+    Every order is validated first; the valid ones are written in ONE transaction
+    with COPY, and inventory is decremented once for the whole batch.
+    Returns one result per input order, in order: {"index", "order_id"} or {"index", "error"}.
+    """
+    data = request.get_json(silent=True)
+    orders_in = data.get('orders') if isinstance(data, dict) else data
+    if not isinstance(orders_in, list) or not orders_in:
+        return jsonify({"error": "Expected a non-empty list of orders"}), 400
+    if len(orders_in) > ORDER_BATCH_MAX:
+        return jsonify({"error": f"At most {ORDER_BATCH_MAX} orders per batch"}), 400
+
+    results = [None] * len(orders_in)
+    valid = []  # (index, order payload, ordered_at)
+    for index, order in enumerate(orders_in):
+        try:
+            order = schemas.to_builtins(schemas.convert(order, schemas.Order, strict=False))
+        except schemas.InvalidRequest as e:
+            results[index] = {"index": index, **e.to_json()}
+            continue
+        ordered_at = _ordered_at(order)
+        if order.get('discount_code'):
+            # Replayed orders are checked against the code as it was on the day they were taken
+            try:
+                order['discount_amount'] = _check_discount(order, ordered_at.date())
+            except schemas.InvalidRequest as e:
+                results[index] = {"index": index, **e.to_json()}
+                continue
+            except Exception as e:
+                print(f"Discount check failed: {e}")
+                return jsonify({"error": "Discount codes unavailable"}), 503
+        valid.append((index, order, ordered_at))
+
+    if not valid:
+        return jsonify({"results": results, "inserted": 0, "failed": len(orders_in)}), 400
+
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "Database connection failed"}), 500
+    try:
+        cur = conn.cursor()
+        order_ids = write_orders(cur, [(order, ordered_at) for _, order, ordered_at in valid])
+        for order_id, (index, _, _) in zip(order_ids, valid):
+            results[index] = {"index": index, "order_id": order_id}
 
         conn.commit()
+        notify("orders")
         cur.close()
-        conn.close()
-        return jsonify({"message": "Order added successfully", "order_id": new_order_id}), 201
+        return jsonify({
+            "results": results,
+            "inserted": len(order_ids),
+            "failed": len(orders_in) - len(order_ids)
+        }), 201 if len(order_ids) == len(orders_in) else 207
     except Exception as e:
         conn.rollback()
         return jsonify({"error": f"Transaction failed: {str(e)}"}), 500
@@ -160,7 +472,7 @@ def get_order_by_id(order_id):
     Function to get a single order by its ID, including all its items
     and their product names.
     """
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
@@ -172,12 +484,10 @@ def get_order_by_id(order_id):
 
         if order_row is None:
             cur.close()
-            conn.close()
             return jsonify({"error": "Order not found"}), 404
 
         # Convert the order row to a dictionary
-        order_columns = [desc[0] for desc in cur.description]
-        order_details = dict(zip(order_columns, order_row))
+        order_details = dict(zip(serialization.columns(cur), order_row))
 
         # items table includes `quantity` (default 1) to support multiple identical items
         # 2. Get all items for that order, joining with products to get product_name
@@ -191,11 +501,7 @@ def get_order_by_id(order_id):
             ORDER BY i.item_id;
         """
         cur.execute(item_sql, (order_id,))
-        item_rows = cur.fetchall()
-
-        # Convert item rows to a list of dictionaries
-        item_columns = [desc[0] for desc in cur.description]
-        order_items = [dict(zip(item_columns, row)) for row in item_rows]
+        order_items = serialization.rows(cur)
 
         # 3. Combine and return
         # This matches what the frontend OrderDetailsModal expects:
@@ -203,8 +509,7 @@ def get_order_by_id(order_id):
         order_details['items'] = order_items
 
         cur.close()
-        conn.close()
-        return jsonify(order_details)
+        return serialization.json_response(order_details)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -215,18 +520,30 @@ def get_order_by_id(order_id):
 @orders_bp.route('/items', methods=['GET'], strict_slashes=False)
 @staff_required
 def get_items():
-    """ Function to get the last 1000 items, most recent first. """
-    conn = get_db_connection()
+    """
+    Function to get the last 1000 items, most recent first.
+    ?stream=ndjson|json streams them from a server-side cursor instead, and then
+    ?limit= can go past 1000 (0 = all items) in constant memory.
+    """
+    try:
+        stream = serialization.stream_format()
+        limit = int(request.args.get("limit", 1000))
+        fetch_size = serialization.fetch_size()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
+    if stream:
+        return serialization.stream_rows(
+            conn, 'SELECT * FROM items ORDER BY item_id DESC LIMIT %s;', (limit or None,), stream, fetch_size
+        )
     try:
         cur = conn.cursor()
         cur.execute('SELECT * FROM items ORDER BY item_id DESC LIMIT 1000;')
-        rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        items = [dict(zip(columns, row)) for row in rows] # Fixed variable name
+        items = serialization.rows(cur)
         cur.close()
-        conn.close()
-        return jsonify(items)
+        return serialization.json_response(items)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -1,6 +1,8 @@
 import os
 import stripe
 from flask import jsonify, request, Blueprint
+from .db import get_db
+from . import stripe_events
 
 # Define the blueprint
 payments_bp = Blueprint("payments", __name__, url_prefix="/api/pay")
@@ -10,23 +12,77 @@ stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
 @payments_bp.route("/", methods=["POST"], strict_slashes=False)
 def create_payment_intent():
+    """
+    {"order_id": 123}: charges that order. The amount comes from the order itself
+    and the intent is recorded on it, so the webhook can mark exactly that order paid.
+    {"amount": 550} (cents, no order) still works for a payment not tied to an order.
+    """
     try:
         data = request.get_json(force=True)
-        amount = data.get("amount")
-        if not amount:
-            return jsonify({"error": "Missing payment amount"}), 400
-
-        intent = stripe.PaymentIntent.create(
-            amount=int(amount),  # must be an integer (in cents)
-            currency="usd",
-            automatic_payment_methods={"enabled": True},
-        )
+        order_id = data.get("order_id")
+        if order_id is None:
+            amount = data.get("amount")
+            if not amount:
+                return jsonify({"error": "Missing payment amount"}), 400
+            intent = stripe.PaymentIntent.create(
+                amount=int(amount),  # must be an integer (in cents)
+                currency="usd",
+                automatic_payment_methods={"enabled": True},
+            )
+            return jsonify({"clientSecret": intent.client_secret, "paymentIntentId": intent.id})
 
-        return jsonify({"clientSecret": intent.client_secret})
+        return _order_payment_intent(order_id)
     except Exception as e:
         print("Stripe error:", e)
         return jsonify({"error": str(e)}), 400
 
+
+def _order_payment_intent(order_id):
+    try:
+        order_id = int(order_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": "order_id must be an integer"}), 400
+
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "Database connection failed"}), 500
+    try:
+        cur = conn.cursor()
+        # The row lock makes a double-clicked "Pay" reuse one intent
+        cur.execute(f"""
+            SELECT {stripe_events.AMOUNT_DUE_SQL}, payment_intent_id, paid_at
+            FROM orders
+            WHERE order_id = %s
+            FOR UPDATE;
+        """, (order_id,))
+        row = cur.fetchone()
+        if row is None:
+            conn.rollback()
+            return jsonify({"error": "Order not found"}), 404
+        amount, payment_intent_id, paid_at = row
+        if paid_at is not None:
+            conn.rollback()
+            return jsonify({"error": "Order is already paid"}), 409
+
+        if payment_intent_id:
+            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        else:
+            intent = stripe.PaymentIntent.create(
+                amount=int(amount),
+                currency="usd",
+                automatic_payment_methods={"enabled": True},
+                metadata={"order_id": str(order_id)},
+                idempotency_key=f"order-{order_id}",
+            )
+            cur.execute("UPDATE orders SET payment_intent_id = %s WHERE order_id = %s;", (intent.id, order_id))
+        conn.commit()
+        cur.close()
+        return jsonify({"clientSecret": intent.client_secret, "paymentIntentId": intent.id, "amount": int(amount)})
+    except Exception as e:
+        conn.rollback()
+        print("Stripe error:", e)
+        return jsonify({"error": str(e)}), 400
+
 @payments_bp.route("/webhook", methods=["POST"])
 def stripe_webhook():
     payload = request.data
@@ -42,14 +98,21 @@ def stripe_webhook():
     except stripe.error.SignatureVerificationError:
         return "Invalid signature", 400
 
-    # ✅ Handle payment success event
-    if event["type"] == "payment_intent.succeeded":
-        payment_intent = event["data"]["object"]
-        amount = payment_intent["amount_received"] / 100
-        email = payment_intent.get("receipt_email")
-        print(f"✅ Payment succeeded for {amount} USD, email={email}")
-
-        # Example: Update order status in DB
-        # mark_order_paid(payment_intent["id"], amount)
+    # Store the event and acknowledge right away; the work happens in
+    # stripe_events.py on a background worker. Redeliveries are dropped.
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "Database connection failed"}), 500  # Stripe will retry
+    try:
+        cur = conn.cursor()
+        stored = stripe_events.store(cur, event["id"], event["type"], payload.decode("utf-8"))
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        conn.rollback()
+        print("Could not store Stripe event:", e)
+        return jsonify({"error": "Could not store event"}), 500
 
-    return jsonify(success=True), 200
\ No newline at end of file
+    if stored:
+        stripe_events.process_async()
+    return jsonify(success=True, duplicate=not stored), 200
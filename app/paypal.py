@@ -1,6 +1,7 @@
-import os, requests
+import os, threading, time
 from flask import Blueprint, jsonify, request
 from dotenv import load_dotenv
+from .http_session import make_session
 
 load_dotenv()
 paypal_bp = Blueprint("paypal", __name__, url_prefix="/api/paypal")
@@ -9,17 +10,85 @@ PAYPAL_CLIENT_ID = os.getenv("PAYPAL_CLIENT_ID")
 PAYPAL_SECRET = os.getenv("PAYPAL_SECRET")
 PAYPAL_API_BASE = os.getenv("PAYPAL_API_BASE", "https://api-m.sandbox.paypal.com")
 
+# PayPal access tokens live for hours (expires_in, usually 32400s), so one token
+# is shared by the whole process and renewed PAYPAL_TOKEN_REFRESH_MARGIN seconds
+# before it runs out. Every call goes over one keep-alive session.
+PAYPAL_TOKEN_REFRESH_MARGIN = float(os.getenv("PAYPAL_TOKEN_REFRESH_MARGIN", 60))
+
+_session = make_session()
+
+
+class _AccessToken:
+    """The cached OAuth token. Only one thread at a time asks PayPal for a new one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+
+    def get(self):
+        if self._token and time.monotonic() < self._expires_at - PAYPAL_TOKEN_REFRESH_MARGIN:
+            return self._token
+        # Inside the margin the old token still works: if someone else is already
+        # renewing it, keep using it rather than waiting
+        if self._token and time.monotonic() < self._expires_at:
+            if not self._lock.acquire(blocking=False):
+                return self._token
+        else:
+            self._lock.acquire()
+        try:
+            if not self._token or time.monotonic() >= self._expires_at - PAYPAL_TOKEN_REFRESH_MARGIN:
+                self._fetch()
+            return self._token
+        finally:
+            self._lock.release()
+
+    def invalidate(self, token):
+        """Forgets `token` (PayPal rejected it), unless it was already replaced."""
+        with self._lock:
+            if self._token == token:
+                self._token = None
+
+    def _fetch(self):
+        requested_at = time.monotonic()
+        auth_response = _session.post(
+            f"{PAYPAL_API_BASE}/v1/oauth2/token",
+            auth=(PAYPAL_CLIENT_ID, PAYPAL_SECRET),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data={"grant_type": "client_credentials"},
+        )
+        auth_response.raise_for_status()
+        data = auth_response.json()
+        self._token = data["access_token"]
+        self._expires_at = requested_at + float(data.get("expires_in", 0))
+
+
+_access_token = _AccessToken()
+
 
 def get_access_token():
-    """Request a short-lived access token from PayPal."""
-    auth_response = requests.post(
-        f"{PAYPAL_API_BASE}/v1/oauth2/token",
-        auth=(PAYPAL_CLIENT_ID, PAYPAL_SECRET),
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        data={"grant_type": "client_credentials"},
+    """Returns the cached PayPal access token, requesting a new one when it is about to expire."""
+    return _access_token.get()
+
+
+def _post(path, **kwargs):
+    """POSTs to the PayPal API with the cached token, renewing it once if PayPal rejects it."""
+    access_token = get_access_token()
+    res = _session.post(
+        f"{PAYPAL_API_BASE}{path}",
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {access_token}"},
+        **kwargs,
     )
-    auth_response.raise_for_status()
-    return auth_response.json()["access_token"]
+    if res.status_code == 401:
+        # Revoked or expired early; only happens once per token
+        _access_token.invalidate(access_token)
+        res = _session.post(
+            f"{PAYPAL_API_BASE}{path}",
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {get_access_token()}"},
+            **kwargs,
+        )
+    res.raise_for_status()
+    return res
 
 
 @paypal_bp.route("/create-order", methods=["POST"])
@@ -31,21 +100,12 @@ def create_order():
         if not amount:
             return jsonify({"error": "Missing amount"}), 400
 
-        access_token = get_access_token()
         order_payload = {
             "intent": "CAPTURE",
             "purchase_units": [{"amount": {"currency_code": "USD", "value": str(amount)}}],
         }
 
-        res = requests.post(
-            f"{PAYPAL_API_BASE}/v2/checkout/orders",
-            json=order_payload,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {access_token}",
-            },
-        )
-        res.raise_for_status()
+        res = _post("/v2/checkout/orders", json=order_payload)
         return jsonify(res.json())
     except Exception as e:
         print("PayPal create_order error:", e)
@@ -56,16 +116,8 @@ def create_order():
 def capture_order(order_id):
     """Step 3: Capture the approved order."""
     try:
-        access_token = get_access_token()
-        res = requests.post(
-            f"{PAYPAL_API_BASE}/v2/checkout/orders/{order_id}/capture",
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {access_token}",
-            },
-        )
-        res.raise_for_status()
+        res = _post(f"/v2/checkout/orders/{order_id}/capture")
         return jsonify(res.json())
     except Exception as e:
         print("PayPal capture_order error:", e)
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
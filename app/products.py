@@ -1,54 +1,112 @@
 # server_flask/app/products.py
 
-from flask import Blueprint, jsonify, request
-from .db import get_db_connection
+import hashlib
+import os
+from flask import Blueprint, Response, jsonify, request
+from .db import get_db, pooled_connection
 from .decorators import manager_required # Import our shared db function
+from .cache import SWRCache, notify, subscribe
+from . import serialization, schemas, menu_translations
 
 # Define the blueprint
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
+# The menu is read by every kiosk and customer screen on load but only changes
+# when a manager edits it, so the serialized catalog is cached with its ETag.
+# add/update/delete_product clear it in this worker (the cache version is bumped,
+# so a load that raced the write isn't kept); other workers pick changes up
+# within PRODUCTS_CACHE_TTL.
+PRODUCTS_CACHE_TTL = float(os.environ.get('PRODUCTS_CACHE_TTL', 30))
+PRODUCTS_CACHE_STALE_TTL = float(os.environ.get('PRODUCTS_CACHE_STALE_TTL', 300))
+# How long browsers may reuse the menu without asking; after that they revalidate (usually a 304)
+PRODUCTS_CLIENT_MAX_AGE = int(os.environ.get('PRODUCTS_CLIENT_MAX_AGE', 30))
+
+catalog_cache = SWRCache("products", ttl=PRODUCTS_CACHE_TTL, stale_ttl=PRODUCTS_CACHE_STALE_TTL)
+subscribe("products", catalog_cache.clear)
+subscribe("product_translations", catalog_cache.clear)
+
+
+def _load_catalog(lang=None):
+    """
+    Returns (json body, strong etag) for the whole product table, with the text
+    fields in `lang` where a stored translation exists (see menu_translations.py).
+    """
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            translations = menu_translations.load(cur, lang) if lang else {}
+            cur.execute('SELECT * FROM products order by product_id asc;')
+            rows = cur.fetchall()
+            columns = serialization.columns(cur)
+        conn.rollback()
+    if translations:
+        id_index = columns.index("product_id")
+        positions = [(columns.index(field), field) for field in menu_translations.TRANSLATED_FIELDS if field in columns]
+        translated_rows = []
+        for row in rows:
+            fields = translations.get(row[id_index])
+            if fields:
+                row = list(row)
+                for index, field in positions:
+                    if field in fields:
+                        row[index] = fields[field]
+            translated_rows.append(row)
+        rows = translated_rows
+    # Prices are Decimals; serialization encodes them as JSON numbers
+    Row = serialization.row_type(columns)
+    body = serialization.encode([Row(*row) for row in rows])
+    # A hash of the body, so every worker hands out the same ETag for the same menu
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
 
 @products_bp.route('/', methods=['GET'], strict_slashes=False)
 def get_products():
-    """ Function to get all products (menu items). """
-    conn = get_db_connection()
-    if conn is None:
-        return jsonify({"error": "Database connection failed"}), 500
+    """
+    Function to get all products (menu items). Supports If-None-Match (304).
+    ?lang=es serves the pre-translated menu (English for products not translated yet).
+    """
+    lang = request.args.get("lang")
+    if lang in (None, "", "en"):
+        lang = None
+    elif lang not in menu_translations.MENU_LANGUAGES:
+        return jsonify({"error": f"lang must be one of: en, {', '.join(menu_translations.MENU_LANGUAGES)}"}), 400
+
     try:
-        cur = conn.cursor()
-        cur.execute('SELECT * FROM products order by product_id asc;')
-        rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        products = []
-        for row in rows:
-            product_dict = dict(zip(columns, row))
-            # Check if 'price' exists and is not None
-            if 'price' in product_dict and product_dict['price'] is not None:
-                # Cast Decimal to float so JSON serializes it as a number
-                product_dict['price'] = float(product_dict['price'])
-            products.append(product_dict)
-        cur.close()
-        conn.close()
-        return jsonify(products)
+        body, etag = catalog_cache.get(("catalog", lang), lambda: _load_catalog(lang))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={PRODUCTS_CLIENT_MAX_AGE}, must-revalidate"
+    return response.make_conditional(request)
+
+
+@products_bp.route('/cache', methods=['GET'])
+@manager_required
+def products_cache_stats():
+    return jsonify(catalog_cache.stats())
+
+
+@products_bp.route('/translations/refresh', methods=['POST'])
+@manager_required
+def refresh_translations():
+    """ Translates any product whose stored translations are missing or out of date. """
+    try:
+        return jsonify({"translated": menu_translations.refresh(), "languages": menu_translations.MENU_LANGUAGES})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 503
+
 
 @products_bp.route('/', methods=['POST'])
 @manager_required
 def add_product():
     """ Function to add a new product. """
-    data = request.get_json()
     try:
-        product_name = data.get('product_name')
-        price = data.get('price')
-        # ... (rest of your fields)
-        if not product_name or price is None:
-            return jsonify({"error": "product_name and price are required"}), 400
-    except Exception as e:
-        return jsonify({"error": "Invalid JSON data provided", "details": str(e)}), 400
+        data = schemas.to_builtins(schemas.decode(request.get_data(), schemas.Product))
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 400
 
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
@@ -65,8 +123,9 @@ def add_product():
         cur.execute(sql_query, values)
         new_id = cur.fetchone()[0]
         conn.commit()
+        notify("products")
+        menu_translations.refresh_async([new_id])
         cur.close()
-        conn.close()
         return jsonify({"message": "Product added successfully", "id": new_id}), 201
     except Exception as e:
         conn.rollback()
@@ -77,16 +136,12 @@ def add_product():
 @manager_required
 def update_product(product_id):
     """ Function to update an existing product using its product_id. """
-    data = request.get_json()
     try:
-        product_name = data.get('product_name')
-        price = data.get('price')
-        if not product_name or price is None:
-            return jsonify({"error": "product_name and price are required"}), 400
-    except Exception as e:
-        return jsonify({"error": "Invalid JSON data", "details": str(e)}), 400
+        data = schemas.to_builtins(schemas.decode(request.get_data(), schemas.Product))
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 400
 
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
@@ -103,13 +158,14 @@ def update_product(product_id):
         )
         cur.execute(sql_query, values)
         conn.commit()
+        notify("products")
 
         rowcount = cur.rowcount  # Get rowcount *before* closing cursor
         cur.close()
-        conn.close()
 
         if rowcount == 0:
             return jsonify({"error": "Product not found"}), 404
+        menu_translations.refresh_async([product_id])
         return jsonify({"message": f"Product {product_id} updated successfully"})
     except Exception as e:
         conn.rollback()
@@ -119,17 +175,18 @@ def update_product(product_id):
 @products_bp.route('/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
     """ Function to delete a product using its product_id. """
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM products WHERE product_id = %s", (product_id,))
+        rowcount = cur.rowcount
+        menu_translations.delete(cur, product_id)
         conn.commit()
+        notify("products")
 
-        rowcount = cur.rowcount
         cur.close()
-        conn.close()
 
         if rowcount == 0:
             return jsonify({"error": "Product not found"}), 404
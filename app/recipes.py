@@ -0,0 +1,151 @@
+# server_flask/app/recipes.py
+#
+# Recipe-driven inventory deduction (migrations/005_recipe_usage.sql).
+#
+# recipe_usage is loaded once into an in-memory usage map, with the
+# "every drink + product + size" part of each recipe already merged, so working
+# out an order's inventory delta is a few dict lookups per item and no queries.
+# The map is reloaded on the next use after a product or inventory write (or
+# after RECIPE_CACHE_TTL, for writes handled by other workers), using the
+# caller's cursor so it can happen inside the order transaction.
+
+import os
+import threading
+import time
+from psycopg2.extras import execute_values
+from .cache import subscribe
+
+RECIPE_CACHE_TTL = float(os.environ.get('RECIPE_CACHE_TTL', 300))
+
+LOAD_SQL = """
+    SELECT r.kind, r.key, inv.name, r.amount
+    FROM recipe_usage r
+    JOIN inventory inv ON inv.inv_item_id = r.inv_item_id;
+"""
+
+
+def _merge(*parts):
+    total = {}
+    for part in parts:
+        for name, amount in part:
+            total[name] = total.get(name, 0) + amount
+    return tuple(total.items())
+
+
+class UsageMap:
+    """Per-drink inventory usage, as tuples of (inventory name, units)."""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        by_kind = {"all": {}, "size": {}, "product": {}, "topping": {}}
+        for kind, key, name, amount in rows:
+            by_kind[kind].setdefault(key, []).append((name, float(amount)))
+
+        self.every_drink = tuple(by_kind["all"].get("", ()))
+        self.sizes = by_kind["size"]
+        self.products = by_kind["product"]
+        self.toppings = {key: tuple(usage) for key, usage in by_kind["topping"].items()}
+        self._base = {}
+        for product_key, product_usage in self.products.items():
+            for size_key, size_usage in self.sizes.items():
+                self._base[(product_key, size_key)] = _merge(self.every_drink, product_usage, size_usage)
+
+    def base(self, product_id, size):
+        key = (str(product_id), size or "")
+        usage = self._base.get(key)
+        if usage is None:
+            # Product or size without a recipe row: whatever parts we do know about
+            usage = _merge(self.every_drink, self.products.get(key[0], ()), self.sizes.get(key[1], ()))
+            self._base[key] = usage
+        return usage
+
+    def add_item(self, total, item):
+        """Adds one order item's usage (times its quantity) to the `total` dict."""
+        quantity = item.get('quantity') or 1
+        for name, amount in self.base(item.get('product_id'), item.get('size')):
+            total[name] = total.get(name, 0) + amount * quantity
+        toppings = item.get('toppings')
+        if toppings:
+            for topping in str(toppings).split(','):
+                for name, amount in self.toppings.get(topping.strip(), ()):
+                    total[name] = total.get(name, 0) + amount * quantity
+        return total
+
+
+_map = None
+_loaded_at = 0.0
+_version = 0
+_lock = threading.Lock()
+
+
+def invalidate():
+    global _version
+    with _lock:
+        _version += 1
+
+
+def get_usage_map(cur):
+    """Returns the current usage map, (re)loading it with `cur` if it is missing or stale."""
+    global _map, _loaded_at
+    with _lock:
+        if _map is not None and _map.version == _version and time.monotonic() - _loaded_at < RECIPE_CACHE_TTL:
+            return _map
+        version = _version
+    cur.execute(LOAD_SQL)
+    usage_map = UsageMap(cur.fetchall(), version)
+    with _lock:
+        _map = usage_map
+        _loaded_at = time.monotonic()
+    return usage_map
+
+
+def order_usage(cur, items):
+    """{inventory name: units} used by one order's items."""
+    usage_map = get_usage_map(cur)
+    total = {}
+    for item in items:
+        usage_map.add_item(total, item)
+    return total
+
+
+def orders_usage(cur, orders):
+    """Bulk form of order_usage: the combined usage of many order payloads (batch ingestion)."""
+    usage_map = get_usage_map(cur)
+    total = {}
+    for order in orders:
+        for item in order['items']:
+            usage_map.add_item(total, item)
+    return total
+
+
+KINDS = ("all", "size", "product", "topping")
+
+
+def replace_all(cur, rows):
+    """
+    Replaces every recipe with `rows` of (kind, key, inventory name, amount) in the
+    caller's transaction. Returns how many rows were stored; raises ValueError
+    (nothing written) for an unknown kind or inventory name or a negative amount.
+    """
+    cur.execute("SELECT name, inv_item_id FROM inventory;")
+    inv_ids = dict(cur.fetchall())
+    values = []
+    for line, (kind, key, name, amount) in enumerate(rows, 1):
+        if kind not in KINDS:
+            raise ValueError(f"Row {line}: kind must be one of {', '.join(KINDS)}, not '{kind}'")
+        if name not in inv_ids:
+            raise ValueError(f"Row {line}: no inventory item named '{name}'")
+        amount = float(amount)
+        if amount < 0:
+            raise ValueError(f"Row {line}: amount can't be negative")
+        values.append((kind, key or "", inv_ids[name], amount))
+
+    cur.execute("DELETE FROM recipe_usage;")
+    if values:
+        execute_values(cur, "INSERT INTO recipe_usage (kind, key, inv_item_id, amount) VALUES %s", values)
+    invalidate()
+    return len(values)
+
+
+subscribe("products", invalidate)
+subscribe("inventory", invalidate)
@@ -2,8 +2,9 @@
 from flask import Blueprint, jsonify
 from datetime import datetime
 import pytz
-from .xz_report import x_report_today, z_report_preview, z_report_close
-from .db import get_db_connection  # ✅ Import your connection function
+from .xz_report import x_report_today, x_report_reconcile, z_report_preview, z_report_close
+from .db import get_db  # ✅ Import your connection function
+from .decorators import manager_required
 
 reports_bp = Blueprint("reports", __name__, url_prefix="/api/reports")
 chicago_tz = pytz.timezone("America/Chicago")
@@ -14,6 +15,25 @@ def x_report_route():
     return jsonify(x_report_today())
 
 
+@reports_bp.route("/x/reconcile", methods=["GET"])
+@manager_required
+def x_reconcile_route():
+    """Compares the X report's running totals with the orders table (read-only)."""
+    result = x_report_reconcile(repair=False)
+    if "error" in result:
+        return jsonify(result), 500
+    return jsonify(result)
+
+
+@reports_bp.route("/x/reconcile/repair", methods=["POST"])
+@manager_required
+def x_reconcile_repair_route():
+    """Rewrites the X report's running totals from the orders table."""
+    result = x_report_reconcile(repair=True)
+    if "error" in result:
+        return jsonify(result), 500
+    return jsonify(result)
+
 
 @reports_bp.route("/z/preview", methods=["GET"])
 def z_preview_route():
@@ -22,7 +42,7 @@ def z_preview_route():
 @reports_bp.route("/z/status", methods=["GET"])
 def z_status_route():
     """Check whether a Z-report has been run today."""
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         return jsonify({"success": False, "error": "Database connection failed"}), 500
     try:
@@ -41,7 +61,6 @@ def z_status_route():
             cur.execute("UPDATE lastzreport SET last_ts = %s", (now_local,))
             conn.commit()
             cur.close()
-            conn.close()
             return jsonify({"success": True, "z_closed_today": False, "closed_at": None})
 
         z_closed_today = False
@@ -52,7 +71,6 @@ def z_status_route():
             cur.execute("UPDATE lastzreport SET last_ts = %s", (now_local,))
             conn.commit()
             cur.close()
-            conn.close()
             return jsonify({"success": True, "z_closed_today": False, "closed_at": None})
 
         last_ts = row[0]
@@ -68,7 +86,6 @@ def z_status_route():
             cur.execute("UPDATE lastzreport SET last_ts = %s", (now_local,))
             conn.commit()
             cur.close()
-            conn.close()
             return jsonify({"success": True, "z_closed_today": False, "closed_at": None})
 
         # Normal same-day check
@@ -77,12 +94,9 @@ def z_status_route():
             closed_at = last_ts.strftime("%Y-%m-%d %H:%M:%S")
 
         cur.close()
-        conn.close()
         return jsonify({"success": True, "z_closed_today": z_closed_today, "closed_at": closed_at})
 
     except Exception as e:
-        if conn:
-            conn.close()
         return jsonify({"success": False, "error": str(e)}), 500
 
 
@@ -91,7 +105,7 @@ def z_close_route():
     """
     Runs the Z-report (end-of-day) only if one has not already been done today.
     """
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         return jsonify({
             "success": False,
@@ -99,55 +113,21 @@ def z_close_route():
         }), 500
 
     try:
-        cur = conn.cursor()
-
-        # 1️⃣ Check if a Z-report has already been run today
-        cur.execute("""
-            SELECT last_ts 
-            FROM lastzreport 
-            ORDER BY last_ts DESC 
-            LIMIT 1;
-        """)
-        row = cur.fetchone()
-
-        # Convert timezones safely
-        central = pytz.timezone("America/Chicago")
-        now_local = datetime.now(central)
-
-        # Only check if we actually have a previous record
-        if row and row[0]:
-            last_ts = row[0]
-
-            # Convert database timestamp (UTC) → local time
-            if last_ts.tzinfo is None:
-                # If your DB stores naive timestamps (no tz), assume UTC
-                last_ts = pytz.utc.localize(last_ts)
-
-            last_local = last_ts.astimezone(central)
-
-            # Compare the local dates
-            if last_local.date() == now_local.date():
-                cur.close()
-                conn.close()
-                return jsonify({
-                    "success": False,
-                    "message": "Z-report already run today. Try again tomorrow."
-                }), 400
-
-        # 2️⃣ Run the close logic (your existing z_report_close function)
+        # The "already run today?" check happens inside z_report_close,
+        # under the same lastzreport lock and transaction as the close itself.
         result = z_report_close()
 
-        conn.commit()
-        cur.close()
-        conn.close()
+        if result.get("already_closed"):
+            return jsonify({
+                "success": False,
+                "message": "Z-report already run today. Try again tomorrow."
+            }), 400
 
         return jsonify(result)
 
     except Exception as e:
         print("Error running Z-report:", e)
-        if conn:
-            conn.rollback()
-            conn.close()
+        conn.rollback()
         return jsonify({
             "success": False,
             "message": "Error running Z-report.",
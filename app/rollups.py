@@ -0,0 +1,152 @@
+# app/rollups.py
+#
+# Per-day aggregates of orders and items (migrations/003_daily_rollups.sql).
+#
+# The dashboard charts used to aggregate the whole items/orders history on every
+# load. These tables hold one row per day and per product / hour / size /
+# topping combo / payment method, so reading them costs days x products rather
+# than every item ever sold.
+#
+# New orders are folded in by order_totals.py a few seconds after they commit
+# (record_orders), exportNewOrdersToDB.py folds in bulk imports
+# (record_orders_from), and rebuildRollups.py recomputes everything from
+# history (rebuild).
+
+ROLLUP_TABLES = (
+    "rollup_daily",
+    "rollup_hour_daily",
+    "rollup_product_daily",
+    "rollup_size_daily",
+    "rollup_topping_daily",
+    "rollup_payment_daily",
+)
+
+# Aggregates the orders matching {order_filter} (and their items) and adds them
+# to every rollup table in one statement. Each INSERT groups by the table's key,
+# so ON CONFLICT never touches the same row twice.
+_APPLY_SQL = """
+    WITH o AS (
+        SELECT order_id,
+               make_date(year, month, day) AS sale_date,
+               EXTRACT(HOUR FROM CAST(time AS time))::int AS hour,
+               payment_method,
+               total_price,
+               tip
+        FROM orders
+        WHERE {order_filter}
+    ),
+    i AS (
+        SELECT o.sale_date,
+               it.product_id,
+               it.size,
+               it.price,
+               CASE WHEN it.toppings = '' OR it.toppings IS NULL THEN 'No Toppings' ELSE it.toppings END AS topping_combo,
+               p.price AS base_price
+        FROM o
+        JOIN items it ON it.order_id = o.order_id
+        LEFT JOIN products p ON p.product_id = it.product_id
+    ),
+    daily AS (
+        INSERT INTO rollup_daily AS r (sale_date, orders, revenue, tips)
+        SELECT sale_date, COUNT(*), COALESCE(SUM(total_price), 0), COALESCE(SUM(tip), 0)
+        FROM o
+        GROUP BY sale_date
+        ON CONFLICT (sale_date) DO UPDATE
+        SET orders = r.orders + EXCLUDED.orders,
+            revenue = r.revenue + EXCLUDED.revenue,
+            tips = r.tips + EXCLUDED.tips
+    ),
+    hourly AS (
+        INSERT INTO rollup_hour_daily AS r (sale_date, hour, orders)
+        SELECT sale_date, hour, COUNT(*)
+        FROM o
+        GROUP BY sale_date, hour
+        ON CONFLICT (sale_date, hour) DO UPDATE
+        SET orders = r.orders + EXCLUDED.orders
+    ),
+    product AS (
+        INSERT INTO rollup_product_daily AS r (sale_date, product_id, items, revenue)
+        SELECT sale_date, product_id, COUNT(*), COALESCE(SUM(price), 0)
+        FROM i
+        WHERE product_id IS NOT NULL
+        GROUP BY sale_date, product_id
+        ON CONFLICT (sale_date, product_id) DO UPDATE
+        SET items = r.items + EXCLUDED.items,
+            revenue = r.revenue + EXCLUDED.revenue
+    ),
+    sized AS (
+        -- the size chart only looks at paid items
+        INSERT INTO rollup_size_daily AS r (sale_date, size, items, revenue)
+        SELECT sale_date, COALESCE(size, ''), COUNT(*), SUM(price)
+        FROM i
+        WHERE price > 0
+        GROUP BY sale_date, COALESCE(size, '')
+        ON CONFLICT (sale_date, size) DO UPDATE
+        SET items = r.items + EXCLUDED.items,
+            revenue = r.revenue + EXCLUDED.revenue
+    ),
+    topping AS (
+        -- base_revenue is the product's menu price at the time of the sale,
+        -- so topping revenue = revenue - base_revenue
+        INSERT INTO rollup_topping_daily AS r (sale_date, topping_combo, items, revenue, base_revenue)
+        SELECT sale_date, topping_combo, COUNT(*), COALESCE(SUM(price), 0), COALESCE(SUM(base_price), 0)
+        FROM i
+        WHERE base_price IS NOT NULL
+        GROUP BY sale_date, topping_combo
+        ON CONFLICT (sale_date, topping_combo) DO UPDATE
+        SET items = r.items + EXCLUDED.items,
+            revenue = r.revenue + EXCLUDED.revenue,
+            base_revenue = r.base_revenue + EXCLUDED.base_revenue
+    ),
+    payment AS (
+        -- sums and counts (not averages), so days can be combined exactly
+        INSERT INTO rollup_payment_daily AS r
+            (sale_date, payment_method, orders, tip_pct_sum, tip_pct_count, value_sum, value_count)
+        SELECT sale_date, COALESCE(payment_method, ''), COUNT(*),
+               COALESCE(SUM(100.0 * tip / total_price), 0), COUNT(tip),
+               COALESCE(SUM(total_price + tip), 0), COUNT(total_price + tip)
+        FROM o
+        WHERE total_price > 0
+        GROUP BY sale_date, COALESCE(payment_method, '')
+        ON CONFLICT (sale_date, payment_method) DO UPDATE
+        SET orders = r.orders + EXCLUDED.orders,
+            tip_pct_sum = r.tip_pct_sum + EXCLUDED.tip_pct_sum,
+            tip_pct_count = r.tip_pct_count + EXCLUDED.tip_pct_count,
+            value_sum = r.value_sum + EXCLUDED.value_sum,
+            value_count = r.value_count + EXCLUDED.value_count
+    )
+    SELECT COUNT(*) FROM o;
+"""
+
+
+def _apply(cur, order_filter, params):
+    cur.execute(_APPLY_SQL.format(order_filter=order_filter), params)
+    return cur.fetchone()[0]
+
+
+def record_orders(cur, order_ids):
+    """Adds a batch of orders (and their items) to the rollups in one statement."""
+    return _apply(cur, "order_id = ANY(%(order_ids)s)", {"order_ids": list(order_ids)})
+
+
+def record_orders_from(cur, first_order_id):
+    """Adds every order with order_id >= first_order_id, e.g. after a bulk import."""
+    return _apply(cur, "order_id >= %(order_id)s", {"order_id": first_order_id})
+
+
+def rebuild(cur, since=None):
+    """
+    Recomputes the rollups from history, either completely or for the days since `since`.
+    Returns the number of orders rolled up.
+    """
+    for table in ROLLUP_TABLES:
+        if since is None:
+            cur.execute(f"DELETE FROM {table};")
+        else:
+            cur.execute(f"DELETE FROM {table} WHERE sale_date >= %s;", (since,))
+
+    # Orders still queued in order_totals_pending get folded in later anyway
+    not_queued = "order_id NOT IN (SELECT order_id FROM order_totals_pending)"
+    if since is None:
+        return _apply(cur, not_queued, {})
+    return _apply(cur, f"make_date(year, month, day) >= %(since)s AND {not_queued}", {"since": since})
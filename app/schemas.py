@@ -0,0 +1,149 @@
+# server_flask/app/schemas.py
+#
+# Request bodies of the write endpoints, as msgspec Structs.
+#
+# A body is decoded and validated in one pass straight from the raw bytes, before
+# the handler asks for a database connection, so malformed requests are rejected
+# with a 400 without ever holding a pooled connection or opening a transaction.
+# Errors look like {"error": "Expected `int`, got `str`", "field": "$.items[0].product_id"}.
+
+from datetime import date, datetime
+from typing import Annotated, Optional, Union
+import msgspec
+
+NonEmptyStr = Annotated[str, msgspec.Meta(min_length=1)]
+NonNegative = Annotated[float, msgspec.Meta(ge=0)]
+
+TIME_FORMATS = ("%H:%M:%S", "%H:%M:%S.%f", "%H:%M")
+
+
+def parse_time(value):
+    """Parses an order's wall-clock time ("14:03:00"), or raises ValueError."""
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(str(value), fmt).time()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time: {value}")
+
+
+class InvalidRequest(Exception):
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.message = message
+        self.field = field
+
+    def to_json(self):
+        body = {"error": self.message}
+        if self.field:
+            body["field"] = self.field
+        return body
+
+
+def _invalid(e):
+    message, _, path = str(e).partition(" - at `")
+    return InvalidRequest(message, path.rstrip("`") or None)
+
+
+def decode(body, schema, strict=False):
+    """
+    Decodes a raw JSON request body into `schema`, raising InvalidRequest.
+    Numbers sent as strings ("4.50" for 4.5) are accepted like Postgres used to;
+    strict=True rejects them.
+    """
+    try:
+        return msgspec.json.decode(body, type=schema, strict=strict)
+    except msgspec.ValidationError as e:
+        raise _invalid(e)
+    except msgspec.DecodeError as e:
+        raise InvalidRequest(f"Malformed JSON: {e}")
+
+
+def convert(obj, schema, strict=False):
+    """Like decode(), for an already parsed object (e.g. one order of a batch)."""
+    try:
+        return msgspec.convert(obj, schema, strict=strict)
+    except msgspec.ValidationError as e:
+        raise _invalid(e)
+
+
+to_builtins = msgspec.to_builtins
+
+
+# --- Orders ---
+
+class OrderItem(msgspec.Struct):
+    product_id: int
+    price: NonNegative
+    size: Optional[str] = None
+    sugar_level: Union[str, int, None] = None
+    ice_level: Union[str, int, None] = None
+    toppings: Optional[str] = None
+    quantity: Annotated[int, msgspec.Meta(ge=1)] = 1
+
+
+class Order(msgspec.Struct):
+    time: NonEmptyStr
+    day: Annotated[int, msgspec.Meta(ge=1, le=31)]
+    month: Annotated[int, msgspec.Meta(ge=1, le=12)]
+    year: Annotated[int, msgspec.Meta(ge=2000)]
+    total_price: NonNegative
+    payment_method: NonEmptyStr
+    items: Annotated[list[OrderItem], msgspec.Meta(min_length=1)]
+    tip: Optional[NonNegative] = None
+    tax: Optional[NonNegative] = None
+    special_notes: Optional[str] = None
+    discount_code: Optional[str] = None  # total_price is then checked against the code
+
+    def __post_init__(self):
+        parse_time(self.time)
+        date(self.year, self.month, self.day)  # e.g. February 30th
+
+
+class DiscountCheck(msgspec.Struct):
+    code: Optional[str] = None
+    items: Optional[list[OrderItem]] = None  # the cart, to get the discounted total
+
+
+# --- Products ---
+
+class Product(msgspec.Struct):
+    product_name: NonEmptyStr
+    price: NonNegative
+    category: Optional[str] = None
+    flavor: Optional[str] = None
+    flavor_2: Optional[str] = None
+    flavor_3: Optional[str] = None
+    milk: Union[str, bool, float, None] = None
+    cream: Union[str, bool, float, None] = None
+    sugar: Union[str, bool, float, None] = None
+
+
+# --- Inventory ---
+
+class InventoryStock(msgspec.Struct):
+    units_remaining: float
+    numServings: float
+
+
+class NewInventoryItem(InventoryStock):
+    name: NonEmptyStr
+
+    def __post_init__(self):
+        self.name = self.name.strip()
+        if not self.name:
+            raise ValueError("name is required")
+
+
+# --- Staff ---
+
+class Employee(msgspec.Struct):
+    name: NonEmptyStr
+    role: NonEmptyStr
+    email: Optional[str] = None
+    salary: Optional[NonNegative] = None
+    hours_worked: Optional[NonNegative] = None
+
+
+class NewEmployee(Employee, kw_only=True):
+    staff_id: Union[int, NonEmptyStr]
@@ -0,0 +1,130 @@
+# server_flask/app/serialization.py
+#
+# Shared query-result -> JSON path for the list endpoints, built on msgspec.
+#
+# Rows are wrapped in a msgspec Struct type made from the cursor's column names
+# (cached per column list) and encoded in C, instead of building a dict per row
+# and going through Flask's pure-Python jsonify. Types are encoded the same way
+# everywhere:
+#   Decimal            -> JSON number
+#   date               -> "YYYY-MM-DD"
+#   time               -> "HH:MM:SS[.ffffff]"
+#   datetime           -> RFC 3339, e.g. "2025-10-01T14:03:00-05:00"
+#
+# stream_rows() is the constant-memory variant for large results: a named
+# (server-side) cursor is read STREAM_FETCH_SIZE rows at a time and each chunk
+# is sent as soon as it is encoded, as NDJSON or as one streamed JSON array.
+
+import os
+import uuid
+from functools import lru_cache
+import msgspec
+from flask import Response, request, stream_with_context
+
+encoder = msgspec.json.Encoder(decimal_format="number")
+
+STREAM_FETCH_SIZE = int(os.environ.get('STREAM_FETCH_SIZE', 2000))
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+@lru_cache(maxsize=256)
+def row_type(columns):
+    """A Struct type whose JSON form is {column: value, ...} for the given column names."""
+    # Column names aren't always identifiers (e.g. "numServings" is, "my col" isn't),
+    # so the fields are positional and renamed to the real names on encode.
+    fields = [(f"c{i}", object) for i in range(len(columns))]
+    return msgspec.defstruct("Row", fields, rename={f"c{i}": name for i, name in enumerate(columns)})
+
+
+def columns(cur):
+    return tuple(desc[0] for desc in cur.description)
+
+
+def rows(cur, fetched=None):
+    """The cursor's rows (or `fetched`, rows already read from it) as JSON-encodable structs."""
+    Row = row_type(columns(cur))
+    if fetched is None:
+        fetched = cur.fetchall()
+    return [Row(*row) for row in fetched]
+
+
+def row(cur, fetched):
+    """One row read from the cursor as a JSON-encodable struct."""
+    return row_type(columns(cur))(*fetched)
+
+
+def encode(payload):
+    return encoder.encode(payload)
+
+
+def json_response(payload, status=200):
+    """Like jsonify, for payloads that may contain row structs, Decimals, dates and times."""
+    return Response(encoder.encode(payload), status=status, mimetype="application/json")
+
+
+def stream_format():
+    """
+    The streaming format the client asked for: ?stream=ndjson|json, or an
+    Accept: application/x-ndjson header. None means a normal (buffered) response.
+    Raises ValueError for an unknown ?stream= value.
+    """
+    fmt = request.args.get("stream")
+    if fmt is None:
+        return "ndjson" if request.accept_mimetypes.best == STREAM_FORMATS["ndjson"] else None
+    if fmt not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+    return fmt
+
+
+def fetch_size():
+    """?fetch_size= (rows per round trip while streaming), defaulting to STREAM_FETCH_SIZE."""
+    return max(1, int(request.args.get("fetch_size", STREAM_FETCH_SIZE)))
+
+
+def stream_rows(conn, sql, params=None, fmt="ndjson", size=None):
+    """
+    Streams the result of `sql` through a server-side cursor on `conn` (the
+    request's connection, which stays checked out until the stream ends).
+    Only `size` rows are in memory at a time. An error after the first chunk
+    can't change the status code any more: NDJSON streams end with an
+    {"error": ...} line, JSON arrays are left unterminated.
+    """
+    size = size or STREAM_FETCH_SIZE
+
+    def generate():
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        cur.itersize = size
+        sent_any = False
+        try:
+            cur.execute(sql, params)
+            Row = None
+            if fmt == "json":
+                yield b"["
+            while True:
+                batch = cur.fetchmany(size)
+                if not batch:
+                    break
+                if Row is None:
+                    Row = row_type(columns(cur))
+                chunk = [Row(*row) for row in batch]
+                if fmt == "ndjson":
+                    yield encoder.encode_lines(chunk)
+                else:
+                    # encode() gives "[...]"; strip the brackets and join chunks with commas
+                    yield (b"," if sent_any else b"") + encoder.encode(chunk)[1:-1]
+                sent_any = True
+            if fmt == "json":
+                yield b"]"
+        except Exception as e:
+            print(f"Streaming query failed: {e}")
+            if fmt == "ndjson":
+                yield encoder.encode({"error": str(e)}) + b"\n"
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass
+            # The named cursor lives in a transaction; end it before the connection goes back to the pool
+            conn.rollback()
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[fmt])
@@ -0,0 +1,140 @@
+# app/shift_totals.py
+#
+# Running totals for the current shift (everything since the last Z report),
+# kept in the shift_totals table (migrations/002_shift_totals.sql).
+#
+# New orders are folded in by order_totals.py (three bucket rows per order date),
+# and z_report_close empties the table in the close transaction, so the X report
+# only has to read a handful of rows instead of aggregating the orders table.
+# Rows are keyed by the order's business date, which is what lets the X report
+# keep its "since midnight, or since today's Z" window.
+#
+#   bucket     bucket_key
+#   'summary'  ''
+#   'payment'  payment method
+#   'hour'     'HH:00'
+
+# Buckets for the orders matching {order_filter}, computed from the orders table
+_AGGREGATE_SQL = """
+    WITH window_orders AS (
+        SELECT make_date(year, month, day) AS business_date,
+               COALESCE(payment_method, '') AS payment_method,
+               LEFT(time::text,2)||':00' AS hour,
+               total_price,
+               tip
+        FROM orders
+        WHERE {order_filter}
+    )
+    SELECT business_date,
+           CASE GROUPING(payment_method, hour) WHEN 3 THEN 'summary' WHEN 1 THEN 'payment' ELSE 'hour' END,
+           CASE GROUPING(payment_method, hour) WHEN 3 THEN '' WHEN 1 THEN payment_method ELSE hour END,
+           COUNT(*),
+           COALESCE(SUM(total_price),0),
+           COALESCE(SUM(tip),0)
+    FROM window_orders
+    GROUP BY GROUPING SETS ((business_date), (business_date, payment_method), (business_date, hour))
+"""
+
+# What shift_totals should contain, recomputed from the orders themselves.
+# Orders still queued in order_totals_pending aren't in shift_totals yet either.
+RECOMPUTE_SQL = _AGGREGATE_SQL.format(
+    order_filter="ordered_at >= %s AND order_id NOT IN (SELECT order_id FROM order_totals_pending)"
+) + ";"
+
+# Running totals of one business date: the folded rows plus the orders still queued
+READ_DAY_SQL = """
+    SELECT bucket, bucket_key, SUM(orders), SUM(revenue), SUM(tips)
+    FROM (
+        SELECT business_date, bucket, bucket_key, orders, revenue, tips
+        FROM shift_totals
+        UNION ALL
+        (""" + _AGGREGATE_SQL.format(order_filter="order_id IN (SELECT order_id FROM order_totals_pending)") + """)
+    ) AS totals (business_date, bucket, bucket_key, orders, revenue, tips)
+    WHERE business_date = %s
+    GROUP BY bucket, bucket_key;
+"""
+
+# Adds many already-inserted orders to the running totals (see order_totals.fold)
+RECORD_ORDERS_SQL = """
+    INSERT INTO shift_totals AS t (business_date, bucket, bucket_key, orders, revenue, tips)
+""" + _AGGREGATE_SQL.format(order_filter="order_id = ANY(%(order_ids)s)") + """
+    ON CONFLICT (business_date, bucket, bucket_key) DO UPDATE
+    SET orders = t.orders + EXCLUDED.orders,
+        revenue = t.revenue + EXCLUDED.revenue,
+        tips = t.tips + EXCLUDED.tips;
+"""
+
+
+def record_orders(cur, order_ids):
+    """Adds many already-inserted orders to the running totals in one statement."""
+    cur.execute(RECORD_ORDERS_SQL, {"order_ids": list(order_ids)})
+
+
+def reset(cur):
+    """Empties the running totals. Called from the Z close transaction."""
+    cur.execute("DELETE FROM shift_totals;")
+
+
+def read_day(cur, business_date):
+    """Returns (summary, by_payment, by_hour) for one business date, same shapes as the X report."""
+    cur.execute(READ_DAY_SQL, (business_date,))
+
+    summary = {"total_orders": 0, "total_revenue": 0.0, "total_tips": 0.0}
+    by_payment = []
+    by_hour = []
+    for bucket, key, orders, revenue, tips in cur.fetchall():
+        if bucket == "summary":
+            summary = {
+                "total_orders": int(orders),
+                "total_revenue": float(revenue),
+                "total_tips": float(tips),
+            }
+        elif bucket == "payment":
+            by_payment.append({"payment_method": key, "orders": int(orders), "revenue": float(revenue)})
+        elif bucket == "hour":
+            by_hour.append({"hour": key, "orders": int(orders), "revenue": float(revenue), "tips": float(tips)})
+
+    by_payment.sort(key=lambda r: r["revenue"], reverse=True)
+    by_hour.sort(key=lambda r: r["hour"])
+    return summary, by_payment, by_hour
+
+
+def reconcile(cur, since, repair=False):
+    """
+    Recomputes the running totals from the orders since `since` (the shift start)
+    and compares them with shift_totals. Returns the list of buckets that drifted.
+    With repair=True the table is rewritten from the recomputed values.
+    Orders still queued in order_totals_pending are left out of both sides, so a
+    read-only check only needs one snapshot (REPEATABLE READ). To repair, hold
+    lastzreport FOR UPDATE and call order_totals.fold() first, in the same transaction.
+    """
+    cur.execute("SELECT business_date, bucket, bucket_key, orders, revenue, tips FROM shift_totals;")
+    stored = {(r[0], r[1], r[2]): r[3:] for r in cur.fetchall()}
+
+    cur.execute(RECOMPUTE_SQL, (since,))
+    expected = {(r[0], r[1], r[2]): r[3:] for r in cur.fetchall()}
+
+    def as_json(values):
+        return {"orders": int(values[0]), "revenue": round(float(values[1]), 2), "tips": round(float(values[2]), 2)}
+
+    drift = []
+    for key in sorted(set(stored) | set(expected), key=lambda k: (str(k[0]), k[1], k[2])):
+        have = as_json(stored.get(key, (0, 0, 0)))
+        want = as_json(expected.get(key, (0, 0, 0)))
+        if have != want:
+            drift.append({
+                "business_date": key[0].isoformat(),
+                "bucket": key[1],
+                "bucket_key": key[2],
+                "stored": have,
+                "expected": want,
+            })
+
+    if repair and drift:
+        reset(cur)
+        cur.executemany(
+            "INSERT INTO shift_totals (business_date, bucket, bucket_key, orders, revenue, tips) VALUES (%s, %s, %s, %s, %s, %s);",
+            [key + tuple(values) for key, values in expected.items()]
+        )
+
+    return drift
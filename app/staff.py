@@ -1,8 +1,9 @@
 # server_flask/app/staff.py
 
 from flask import Blueprint, jsonify, request
-from .db import get_db_connection
+from .db import get_db
 from .decorators import manager_required
+from . import serialization, schemas
 
 staff_bp = Blueprint('staff', __name__, url_prefix='/api/staff')
 
@@ -11,18 +12,15 @@ staff_bp = Blueprint('staff', __name__, url_prefix='/api/staff')
 @manager_required
 def get_staff():
     """ Function to get all staff members. """
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
         cur = conn.cursor()
         cur.execute('SELECT * FROM staff order by staff_id asc;')
-        rows = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        staff = [dict(zip(columns, row)) for row in rows]  # Fixed variable name
+        staff = serialization.rows(cur)
         cur.close()
-        conn.close()
-        return jsonify(staff)
+        return serialization.json_response(staff)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -31,18 +29,13 @@ def get_staff():
 @manager_required
 def add_employee():
     """ Function to add a new employee. """
-    data = request.get_json()
     try:
-        staff_id = data.get('staff_id')
-        name = data.get('name')
-        role = data.get('role')
-        email = data.get('email')
-        if not staff_id or not name or not role:
-            return jsonify({"error": "staff_id, name, and role are required"}), 400
-    except Exception as e:
-        return jsonify({"error": "Invalid JSON data", "details": str(e)}), 400
+        data = schemas.to_builtins(schemas.decode(request.get_data(), schemas.NewEmployee))
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 400
+    staff_id, name, role, email = data['staff_id'], data['name'], data['role'], data['email']
 
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
@@ -55,7 +48,6 @@ def add_employee():
         cur.execute(sql_query, values)
         conn.commit()
         cur.close()
-        conn.close()
         return jsonify({"message": f"Employee {name} added successfully"}), 201
     except Exception as e:
         conn.rollback()
@@ -66,17 +58,13 @@ def add_employee():
 @manager_required
 def update_employee(staff_id):
     """ Function to update an existing employee's details. """
-    data = request.get_json()
     try:
-        name = data.get('name')
-        role = data.get('role')
-        email = data.get('email')
-        if not name or not role:
-            return jsonify({"error": "name and role are required"}), 400
-    except Exception as e:
-        return jsonify({"error": "Invalid JSON data", "details": str(e)}), 400
+        data = schemas.to_builtins(schemas.decode(request.get_data(), schemas.Employee))
+    except schemas.InvalidRequest as e:
+        return jsonify(e.to_json()), 400
+    name, role, email = data['name'], data['role'], data['email']
 
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
@@ -91,7 +79,6 @@ def update_employee(staff_id):
 
         rowcount = cur.rowcount
         cur.close()
-        conn.close()
 
         if rowcount == 0:
             return jsonify({"error": "Staff member not found"}), 404
@@ -105,7 +92,7 @@ def update_employee(staff_id):
 @manager_required
 def remove_employee(staff_id):
     """ Function to remove an employee using their staff_id. """
-    conn = get_db_connection()
+    conn = get_db()
     if conn is None:
         return jsonify({"error": "Database connection failed"}), 500
     try:
@@ -115,7 +102,6 @@ def remove_employee(staff_id):
 
         rowcount = cur.rowcount
         cur.close()
-        conn.close()
 
         if rowcount == 0:
             return jsonify({"error": "Staff member not found"}), 404
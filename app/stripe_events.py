@@ -0,0 +1,176 @@
+# server_flask/app/stripe_events.py
+#
+# Stripe webhook event store (migrations/009_stripe_events.sql).
+#
+# The webhook only verifies the signature and INSERTs the event, keyed by its
+# Stripe event id, then answers 200 right away. Stripe redelivers events (and
+# sometimes sends the same one twice), so a duplicate id is simply dropped.
+# The actual work happens here, on a background worker:
+#   payment_intent.succeeded -> the matching order gets paid_at
+#   anything else            -> stored for the record, nothing to do
+# The server creates an order's PaymentIntent itself (payments.py), for the
+# amount the order says is due, and stores its id in orders.payment_intent_id.
+# An order is only marked paid by that id, and only if amount_received covers
+# what is due; anything short of that is given up as 'failed' at once. An event
+# whose order can't be found yet is retried with backoff before it fails
+# (replayStripeEvents.py puts failed events back in the queue). Intents made
+# without an order (plain {"amount"} payments) have nothing to mark.
+
+import os
+import threading
+from .db import pooled_connection
+from . import background
+
+STRIPE_EVENT_INTERVAL = float(os.environ.get('STRIPE_EVENT_INTERVAL', 5))
+STRIPE_EVENT_BATCH = int(os.environ.get('STRIPE_EVENT_BATCH', 100))
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.environ.get('STRIPE_EVENT_MAX_ATTEMPTS', 10))
+
+_process_lock = threading.Lock()
+
+# What an order costs the customer, in cents
+AMOUNT_DUE_SQL = "round((total_price + COALESCE(tax, 0) + COALESCE(tip, 0)) * 100)::bigint"
+
+MARK_PAID_SQL = f"""
+    UPDATE orders
+    SET paid_at = COALESCE(paid_at, to_timestamp(%(paid_at)s))
+    WHERE payment_intent_id = %(payment_intent_id)s
+    RETURNING order_id, {AMOUNT_DUE_SQL}
+"""
+
+
+class NoMatchingOrder(Exception):
+    """The event is fine, but the order it pays for isn't in the database (yet)."""
+
+
+class PaymentMismatch(Exception):
+    """The payment can't settle its order (too little, wrong currency); retrying won't help."""
+
+
+def store(cur, event_id, event_type, payload):
+    """
+    Saves a verified event (payload is the raw JSON body) in the caller's transaction.
+    Returns False if the event id was already stored.
+    """
+    cur.execute("""
+        INSERT INTO stripe_events (event_id, event_type, payload)
+        VALUES (%s, %s, %s::jsonb)
+        ON CONFLICT (event_id) DO NOTHING
+        RETURNING event_id;
+    """, (event_id, event_type, payload))
+    return cur.fetchone() is not None
+
+
+def _payment_succeeded(cur, event):
+    intent = event["data"]["object"]
+    if not (intent.get("metadata") or {}).get("order_id"):
+        return  # not an order payment
+    received = int(intent.get("amount_received") or 0)
+    if (intent.get("currency") or "").lower() != "usd":
+        raise PaymentMismatch(f"PaymentIntent {intent['id']} is in {intent.get('currency')}, not usd")
+
+    cur.execute(MARK_PAID_SQL, {"paid_at": event.get("created"), "payment_intent_id": intent["id"]})
+    row = cur.fetchone()
+    if row is None:
+        raise NoMatchingOrder(f"No order for PaymentIntent {intent['id']}")
+    order_id, due = row
+    if received < due:
+        # Raising rolls the UPDATE back (the caller's savepoint)
+        raise PaymentMismatch(f"PaymentIntent {intent['id']} received {received} cents, order {order_id} is {due}")
+    print(f"Stripe payment {intent['id']} ({received / 100} USD) marked order {order_id} paid")
+
+
+HANDLERS = {
+    "payment_intent.succeeded": _payment_succeeded,
+}
+
+
+def process_pending(limit=None):
+    """
+    Handles the events that are due, oldest first. Safe to run from several
+    processes at once (rows are claimed with SKIP LOCKED). Returns how many events
+    were worked through, whether handled or postponed.
+    """
+    if not _process_lock.acquire(blocking=False):
+        return 0  # this process is already on it
+    try:
+        with pooled_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT event_id, event_type, payload
+                    FROM stripe_events
+                    WHERE status = 'pending' AND next_attempt_at <= now()
+                    ORDER BY received_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED;
+                """, (limit or STRIPE_EVENT_BATCH,))
+                events = cur.fetchall()
+
+                for event_id, event_type, payload in events:
+                    handler = HANDLERS.get(event_type)
+                    cur.execute("SAVEPOINT stripe_event;")
+                    try:
+                        if handler is not None:
+                            handler(cur, payload)
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT stripe_event;")
+                        if not isinstance(e, NoMatchingOrder):
+                            print(f"Stripe event {event_id} failed: {e}")
+                        # 2, 4, 8... seconds, at most an hour apart
+                        max_attempts = 1 if isinstance(e, PaymentMismatch) else STRIPE_EVENT_MAX_ATTEMPTS
+                        cur.execute("""
+                            UPDATE stripe_events
+                            SET attempts = attempts + 1,
+                                last_error = %s,
+                                status = CASE WHEN attempts + 1 >= %s THEN 'failed' ELSE 'pending' END,
+                                next_attempt_at = now() + make_interval(secs => LEAST(power(2, attempts + 1), 3600))
+                            WHERE event_id = %s;
+                        """, (str(e), max_attempts, event_id))
+                        continue
+                    cur.execute("""
+                        UPDATE stripe_events
+                        SET status = 'done', attempts = attempts + 1, processed_at = now(), last_error = NULL
+                        WHERE event_id = %s;
+                    """, (event_id,))
+            conn.commit()
+        return len(events)
+    finally:
+        _process_lock.release()
+
+
+def process_async():
+    """Handles a just-stored event right away instead of on the next periodic run."""
+    def run():
+        try:
+            process_pending()
+        except Exception as e:
+            print(f"Could not process Stripe events: {e}")
+
+    threading.Thread(target=run, name="stripe-events-now", daemon=True).start()
+
+
+def counts(cur):
+    """{status: number of events}."""
+    cur.execute("SELECT status, count(*) FROM stripe_events GROUP BY status;")
+    return dict(cur.fetchall())
+
+
+def requeue(cur, event_ids=None, since=None):
+    """
+    Puts events back in the queue: the given ids (whatever their status), every
+    event received since `since`, or by default every 'failed' one. Returns the count.
+    """
+    if event_ids:
+        where, params = "event_id = ANY(%s)", (list(event_ids),)
+    elif since is not None:
+        where, params = "received_at >= %s", (since,)
+    else:
+        where, params = "status = 'failed'", ()
+    cur.execute(f"""
+        UPDATE stripe_events
+        SET status = 'pending', attempts = 0, next_attempt_at = now(), last_error = NULL
+        WHERE {where};
+    """, params)
+    return cur.rowcount
+
+
+background.periodic("stripe-events", STRIPE_EVENT_INTERVAL, process_pending)
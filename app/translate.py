@@ -1,6 +1,12 @@
+import hashlib
 import os
 from flask import Blueprint, jsonify, request
 from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+from .db import pooled_connection
+from .cache import LRUCache
+from .decorators import manager_required
+from .http_session import make_session
 
 load_dotenv()
 
@@ -22,21 +28,129 @@ import requests
 API_KEY = os.environ.get('GOOGLE_TRANSLATE_API_KEY')
 BASE_URL = "https://translation.googleapis.com/language/translate/v2"
 
+# Translations of the same text never change, so they are cached forever:
+# an in-process LRU in front of the translations table (migrations/007_translations.sql).
+# Only texts found in neither go to Google, all in one request per UPSTREAM_BATCH strings.
+TRANSLATE_LRU_SIZE = int(os.environ.get('TRANSLATE_LRU_SIZE', 10000))
+TRANSLATE_BATCH_MAX = int(os.environ.get('TRANSLATE_BATCH_MAX', 500))
+UPSTREAM_BATCH = 128  # Google's limit of q values per request
+
+translation_cache = LRUCache("translations", TRANSLATE_LRU_SIZE)
+_session = make_session()
+
+
+class TranslateError(Exception):
+    """Google Translate couldn't be reached or answered with something unexpected."""
+
+    def __init__(self, message, status_code=503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _hash(text):
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def _load_stored(texts, target_language):
+    """{text: translation} for the texts already in the translations table."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT source_text, translated_text FROM translations WHERE target_language = %s AND source_hash = ANY(%s);",
+                (target_language, [_hash(text) for text in texts])
+            )
+            rows = cur.fetchall()
+        conn.rollback()
+    return dict(rows)
+
+
+def _store(translated, target_language):
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, """
+                INSERT INTO translations (target_language, source_hash, source_text, translated_text)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+            """, [(target_language, _hash(text), text, result) for text, result in translated.items()])
+        conn.commit()
+
+
+def _call_google(texts, target_language):
+    """Translates texts with one request per UPSTREAM_BATCH strings (repeated q parameters)."""
+    translated = {}
+    for start in range(0, len(texts), UPSTREAM_BATCH):
+        chunk = texts[start:start + UPSTREAM_BATCH]
+        try:
+            response = _session.post(
+                BASE_URL,
+                params={'key': API_KEY},
+                data={'q': chunk, 'target': target_language, 'format': 'text'}
+            )
+            response.raise_for_status()  # Raises an error for bad responses
+            for text, result in zip(chunk, response.json()['data']['translations']):
+                translated[text] = result['translatedText']
+        except requests.exceptions.RequestException as e:
+            print(f"Error calling Translate API: {e}")
+            raise TranslateError("Could not fetch translation")
+        except (KeyError, TypeError, ValueError):
+            print(f"Unexpected JSON response from Translate API: {response.text[:500]}")
+            raise TranslateError("Unexpected data format from translate API", 500)
+    return translated
+
+
+def translate_texts(texts, target_language):
+    """
+    Returns (translations in the same order as texts, number of texts sent upstream).
+    Memory first, then the translations table, then one batched Google call for the rest.
+    Raises TranslateError if Google is needed and fails.
+    """
+    found = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        cached = translation_cache.get((target_language, text))
+        if cached is not None:
+            found[text] = cached
+        else:
+            missing.append(text)
+
+    if missing:
+        try:
+            stored = _load_stored(missing, target_language)
+        except Exception as e:
+            # The table is only a cache; carry on without it
+            print(f"Translation cache lookup failed: {e}")
+            stored = {}
+        for text, result in stored.items():
+            found[text] = result
+            translation_cache.put((target_language, text), result)
+        missing = [text for text in missing if text not in stored]
+
+    if missing:
+        if not API_KEY:
+            raise TranslateError("Translation API key not configured", 500)
+        fresh = _call_google(missing, target_language)
+        for text, result in fresh.items():
+            found[text] = result
+            translation_cache.put((target_language, text), result)
+        try:
+            _store(fresh, target_language)
+        except Exception as e:
+            print(f"Could not save translations: {e}")
+
+    return [found[text] for text in texts], len(missing)
+
 
 @translate_bp.route('/', methods=['POST'], strict_slashes=False)
 def handle_translate():
     """
-    Fetches a translation from the Google Translate API.
+    Fetches a translation from the Google Translate API (or the translation cache).
     The frontend must send a JSON body with:
     {
         "text": "The text to translate",
         "target_language": "es" (e.g., "es" for Spanish)
     }
     """
-    if not API_KEY:
-        return jsonify({"error": "Translation API key not configured"}), 500
-
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
 
     text_to_translate = data.get('text')
     target_language = data.get('target_language')
@@ -44,33 +158,53 @@ def handle_translate():
     if not text_to_translate or not target_language:
         return jsonify({"error": "Missing 'text' or 'target_language' in request body"}), 400
 
-    # Construct the query parameters
-    params = {
-        'q': text_to_translate,
-        'target': target_language,
-        'key': API_KEY,
-        'format': 'text'
+    try:
+        [translated_text], _ = translate_texts([text_to_translate], target_language)
+    except TranslateError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    return jsonify({
+        "original_text": text_to_translate,
+        "translated_text": translated_text,
+        "target_language": target_language
+    })
+
+
+@translate_bp.route('/batch', methods=['POST'], strict_slashes=False)
+def handle_translate_batch():
+    """
+    Translates many strings at once. Body:
+    {
+        "texts": ["Milk Tea", "Boba", ...],
+        "target_language": "es"
     }
+    Cached strings are answered locally; only the rest go to Google, in one request.
+    """
+    data = request.get_json(silent=True) or {}
+    texts = data.get('texts')
+    target_language = data.get('target_language')
+
+    if not isinstance(texts, list) or not target_language or not all(isinstance(t, str) and t for t in texts):
+        return jsonify({"error": "Expected 'texts' (a list of non-empty strings) and 'target_language'"}), 400
+    if len(texts) > TRANSLATE_BATCH_MAX:
+        return jsonify({"error": f"At most {TRANSLATE_BATCH_MAX} texts per batch"}), 400
 
     try:
-        # Call the external API
-        response = requests.post(BASE_URL, params=params)
-        response.raise_for_status()  # Raises an error for bad responses
-
-        json_response = response.json()
-
-        # Extract the translated text from the complex response
-        translated_text = json_response['data']['translations'][0]['translatedText']
-
-        return jsonify({
-            "original_text": text_to_translate,
-            "translated_text": translated_text,
-            "target_language": target_language
-        })
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling Translate API: {e}")
-        return jsonify({"error": "Could not fetch translation"}), 503
-    except KeyError:
-        print(f"Unexpected JSON response from Translate API: {json_response}")
-        return jsonify({"error": "Unexpected data format from translate API"}), 500
+        translated, sent_upstream = translate_texts(texts, target_language)
+    except TranslateError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    return jsonify({
+        "target_language": target_language,
+        "translations": [
+            {"original_text": text, "translated_text": result}
+            for text, result in zip(texts, translated)
+        ],
+        "translated_upstream": sent_upstream
+    })
+
+
+@translate_bp.route('/cache', methods=['GET'])
+@manager_required
+def translate_cache_stats():
+    return jsonify(translation_cache.stats())
@@ -2,6 +2,9 @@ import os
 import requests
 from flask import Blueprint, jsonify, request  # <-- Import 'request'
 from dotenv import load_dotenv
+from .cache import SWRCache
+from .decorators import manager_required
+from .http_session import make_session
 
 load_dotenv()
 
@@ -20,45 +23,58 @@ BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
 CSTAT_LAT = "32.05"
 CSTAT_LON = "118.80"
 
+# Every terminal in a store asks for (nearly) the same spot every few seconds.
+# Coordinates are rounded to WEATHER_COORD_DECIMALS places (2 = about 1 km) and
+# each bucket is fetched at most once per WEATHER_CACHE_TTL; after that the old
+# reading is served while one background refresh runs.
+WEATHER_CACHE_TTL = float(os.environ.get('WEATHER_CACHE_TTL', 600))
+WEATHER_CACHE_STALE_TTL = float(os.environ.get('WEATHER_CACHE_STALE_TTL', 3600))
+WEATHER_COORD_DECIMALS = int(os.environ.get('WEATHER_COORD_DECIMALS', 2))
+
+weather_cache = SWRCache("weather", ttl=WEATHER_CACHE_TTL, stale_ttl=WEATHER_CACHE_STALE_TTL, max_entries=1024)
+_session = make_session()
+
+
+def _fetch_weather(lat, lon):
+    """Calls OpenWeatherMap for one coordinate bucket and simplifies the answer."""
+    response = _session.get(BASE_URL, params={"lat": lat, "lon": lon, "appid": API_KEY, "units": "imperial"})
+    response.raise_for_status()  # Raises an error for bad responses (4xx, 5xx)
+
+    data = response.json()
+
+    # Simplify the data to send to the frontend
+    return {
+        "temp": data["main"]["temp"],
+        "feels_like": data["main"]["feels_like"],
+        "description": data["weather"][0]["description"].title(),
+        "icon": data["weather"][0]["icon"],
+        "city": data["name"]
+    }
+
 
 @weather_bp.route('/', methods=['GET'], strict_slashes=False)
 def get_weather():
     """
-    Fetches the current weather from the OpenWeatherMap API.
+    Fetches the current weather from the OpenWeatherMap API (cached per rounded location).
     It accepts 'lat' and 'lon' query parameters.
     If they are missing, it defaults to College Station.
     """
     if not API_KEY:
         return jsonify({"error": "Weather API key not configured"}), 500
 
-    # --- THIS IS THE NEW LOGIC ---
     # Get lat/lon from the request URL (e.g., /api/weather?lat=...&lon=...)
     # If they aren't provided, use the CStat defaults
-    lat = request.args.get('lat', default=CSTAT_LAT)
-    lon = request.args.get('lon', default=CSTAT_LON)
-    # --- END NEW LOGIC ---
-
-    # Construct the full API URL using lat/lon
-    query_params = f"?lat={lat}&lon={lon}&appid={API_KEY}&units=imperial"
-    full_url = BASE_URL + query_params
-
     try:
-        # Call the external API
-        response = requests.get(full_url)
-        response.raise_for_status()  # Raises an error for bad responses (4xx, 5xx)
-
-        data = response.json()
+        lat = round(float(request.args.get('lat', default=CSTAT_LAT)), WEATHER_COORD_DECIMALS)
+        lon = round(float(request.args.get('lon', default=CSTAT_LON)), WEATHER_COORD_DECIMALS)
+    except ValueError:
+        return jsonify({"error": "lat and lon must be numbers"}), 400
+    # Also rules out nan (never equal to itself, so never a cache hit) and inf
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "lat must be within [-90, 90] and lon within [-180, 180]"}), 400
 
-        # Simplify the data to send to the frontend
-        weather_data = {
-            "temp": data["main"]["temp"],
-            "feels_like": data["main"]["feels_like"],
-            "description": data["weather"][0]["description"].title(),
-            "icon": data["weather"][0]["icon"],
-            "city": data["name"]
-        }
-
-        return weather_data;
+    try:
+        return jsonify(weather_cache.get((lat, lon), lambda: _fetch_weather(lat, lon)))
 
     except requests.exceptions.RequestException as e:
         # Handle errors (e.g., API key wrong, network down)
@@ -68,3 +84,8 @@ def get_weather():
         # Handle unexpected JSON structure
         return jsonify({"error": "Unexpected data format from weather API"}), 500
 
+
+@weather_bp.route('/cache', methods=['GET'])
+@manager_required
+def weather_cache_stats():
+    return jsonify(weather_cache.stats())
@@ -1,20 +1,25 @@
 # app/xz_report.py
 from datetime import datetime
-from .db import get_db_connection
+from .db import get_db
+from . import shift_totals, order_totals
 import pytz
 
-ORDER_TS_SQL = """
-  to_timestamp(
-    concat(year,'-',lpad(month::text,2,'0'),'-',lpad(day::text,2,'0'),' ', time::text),
-    'YYYY-MM-DD HH24:MI:SS'
-  )
-"""
+# orders.ordered_at is materialized and indexed (migrations/001_orders_ordered_at.sql),
+# so a report window is an index range scan over the orders since the start time.
+ORDER_SINCE_SQL = "ordered_at >= %s"
+
 
+def _since(ts):
+    """lastzreport and our midnight are naive Chicago wall-clock times; ordered_at is a timestamptz."""
+    if ts.tzinfo is None:
+        return pytz.timezone("America/Chicago").localize(ts)
+    return ts
 
 
-def _get_last_z_timestamp(conn):
+def _get_last_z_timestamp(conn, for_update=False):
     with conn.cursor() as cur:
-        cur.execute("SELECT last_ts FROM lastzreport LIMIT 1;")
+        # FOR UPDATE makes concurrent Z closes wait on each other
+        cur.execute("SELECT last_ts FROM lastzreport LIMIT 1" + (" FOR UPDATE;" if for_update else ";"))
         row = cur.fetchone()
         return row[0] if row and row[0] else None
 
@@ -35,12 +40,11 @@ def _get_start_time(conn):
     else:
         # No Z today → start from midnight
         start_time = midnight_today
-    print (start_time)
 
     return start_time, last_z
 
 
-def _get_z_start_time(conn):
+def _get_z_start_time(conn, for_update=False):
     """Return start time for Z reports:
        - always start from last Z timestamp if exists
        - else start from today's midnight
@@ -48,7 +52,7 @@ def _get_z_start_time(conn):
     """
     central = pytz.timezone("America/Chicago")
     now = datetime.now(central)
-    last_z = _get_last_z_timestamp(conn)
+    last_z = _get_last_z_timestamp(conn, for_update)
     midnight_today = datetime.combine(now.date(), datetime.min.time())
 
     if last_z:
@@ -61,180 +65,175 @@ def _get_z_start_time(conn):
     return start_time, last_z
 
 
+# One scan over the report window: GROUPING SETS yields the summary row,
+# one row per payment method and one row per hour from the same snapshot,
+# so the three sections always agree with each other.
+REPORT_SQL = f"""
+    WITH window_orders AS (
+        SELECT payment_method,
+               LEFT(time::text,2)||':00' AS hour,
+               total_price,
+               tip
+        FROM orders
+        WHERE {ORDER_SINCE_SQL}
+    )
+    SELECT GROUPING(payment_method, hour) AS grouping_id,
+           payment_method,
+           hour,
+           COUNT(*),
+           COALESCE(SUM(total_price),0),
+           COALESCE(SUM(tip),0)
+    FROM window_orders
+    GROUP BY GROUPING SETS ((), (payment_method), (hour));
+"""
+
+# GROUPING() sets a bit for every argument that is NOT part of the row's grouping set
+_GROUP_BY_PAYMENT = 1
+_GROUP_BY_HOUR = 2
+_GROUP_SUMMARY = 3
+
+
+def _run_report(cur, start_time):
+    """Returns (summary, by_payment, by_hour) for every order since start_time."""
+    cur.execute(REPORT_SQL, (_since(start_time),))
+
+    summary = {"total_orders": 0, "total_revenue": 0.0, "total_tips": 0.0}
+    by_payment = []
+    by_hour = []
+    for grouping_id, payment_method, hour, orders, revenue, tips in cur.fetchall():
+        if grouping_id == _GROUP_SUMMARY:
+            summary = {
+                "total_orders": int(orders or 0),
+                "total_revenue": float(revenue or 0),
+                "total_tips": float(tips or 0),
+            }
+        elif grouping_id == _GROUP_BY_PAYMENT:
+            by_payment.append({"payment_method": payment_method, "orders": int(orders), "revenue": float(revenue)})
+        elif grouping_id == _GROUP_BY_HOUR:
+            by_hour.append({"hour": hour, "orders": int(orders), "revenue": float(revenue), "tips": float(tips)})
+
+    by_payment.sort(key=lambda r: r["revenue"], reverse=True)
+    by_hour.sort(key=lambda r: r["hour"] or "")
+    return summary, by_payment, by_hour
+
+
 def x_report_today():
-    """X report: totals since midnight or last Z if earlier."""
-    conn = get_db_connection()
+    """X report: totals since midnight or last Z if later, read from the shift running totals."""
+    conn = get_db()
     if not conn:
         return {"summary": {}, "by_payment": [], "by_hour": []}
 
-    try:
-        start_time, _ = _get_start_time(conn)
-        with conn.cursor() as cur:
-            # Summary
-            cur.execute(f"""
-                SELECT COUNT(*) AS total_orders,
-                       COALESCE(SUM(total_price),0),
-                       COALESCE(SUM(tip),0)
-                FROM orders
-                WHERE {ORDER_TS_SQL} >= %s;
-            """, (start_time,))
-            total_orders, total_revenue, total_tips = cur.fetchone() or (0, 0, 0)
-
-            # By payment
-            cur.execute(f"""
-                SELECT payment_method,
-                       COUNT(*),
-                       COALESCE(SUM(total_price),0)
-                FROM orders
-                WHERE {ORDER_TS_SQL} >= %s
-                GROUP BY payment_method
-                ORDER BY 3 DESC;
-            """, (start_time,))
-            by_payment = [
-                {"payment_method": r[0], "orders": int(r[1]), "revenue": float(r[2])}
-                for r in cur.fetchall()
-            ]
-
-            # By hour
-            cur.execute(f"""
-                SELECT LEFT(time::text,2)||':00' AS hour,
-                       COUNT(*),
-                       COALESCE(SUM(total_price),0),
-                       COALESCE(SUM(tip),0)
-                FROM orders
-                WHERE {ORDER_TS_SQL} >= %s
-                GROUP BY hour
-                ORDER BY hour;
-            """, (start_time,))
-            by_hour = [
-                {"hour": r[0], "orders": int(r[1]), "revenue": float(r[2]), "tips": float(r[3])}
-                for r in cur.fetchall()
-            ]
-
-            return {
-                "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "summary": {
-                    "total_orders": int(total_orders or 0),
-                    "total_revenue": float(total_revenue or 0),
-                    "total_tips": float(total_tips or 0),
-                },
-                "by_payment": by_payment,
-                "by_hour": by_hour,
-            }
-    finally:
-        conn.close()
+    start_time, _ = _get_start_time(conn)
+    today = datetime.now(pytz.timezone("America/Chicago")).date()
+    with conn.cursor() as cur:
+        # Read the running totals instead of aggregating orders (see shift_totals.py)
+        summary, by_payment, by_hour = shift_totals.read_day(cur, today)
+
+    return {
+        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": summary,
+        "by_payment": by_payment,
+        "by_hour": by_hour,
+    }
 
 
 def z_report_preview():
     """Preview Z report since last Z or midnight.
        Note: Z reports always start from last Z timestamp, not midnight, if last Z exists.
     """
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         return {"summary": {}, "by_payment": [], "last_z": None}
 
-    try:
-        start_time, last_z = _get_z_start_time(conn)
-        with conn.cursor() as cur:
-            # Summary
-            cur.execute(f"""
-                SELECT COUNT(*),
-                       COALESCE(SUM(total_price),0),
-                       COALESCE(SUM(tip),0)
-                FROM orders
-                WHERE {ORDER_TS_SQL} >= %s;
-            """, (start_time,))
-            total_orders, total_revenue, total_tips = cur.fetchone() or (0, 0, 0)
-
-            # By payment
-            cur.execute(f"""
-                SELECT payment_method,
-                       COUNT(*),
-                       COALESCE(SUM(total_price),0)
-                FROM orders
-                WHERE {ORDER_TS_SQL} >= %s
-                GROUP BY payment_method
-                ORDER BY 3 DESC;
-            """, (start_time,))
-            by_payment = [
-                {"payment_method": r[0], "orders": int(r[1]), "revenue": float(r[2])}
-                for r in cur.fetchall()
-            ]
-
-            summary = {
-                "total_orders": int(total_orders or 0),
-                "total_revenue": float(total_revenue or 0),
-                "total_tips": float(total_tips or 0),
-            }
+    start_time, last_z = _get_z_start_time(conn)
+    with conn.cursor() as cur:
+        summary, by_payment, _ = _run_report(cur, start_time)
 
-            return {
-                "last_z": last_z.strftime("%Y-%m-%d %H:%M:%S") if last_z else None,
-                "summary": summary,
-                "by_payment": by_payment,
-            }
-    finally:
-        conn.close()
+    return {
+        "last_z": last_z.strftime("%Y-%m-%d %H:%M:%S") if last_z else None,
+        "summary": summary,
+        "by_payment": by_payment,
+    }
 
 
 def z_report_close():
     """Close Z report for today and update last_ts in the database.
        Note: Z reports always start from last Z timestamp, not midnight, if last Z exists.
+       Returns {"already_closed": True, ...} without touching anything if a Z already ran today.
     """
-    conn = get_db_connection()
+    conn = get_db()
     if not conn:
         return {"closed_at": None, "summary": {}, "by_payment": []}
 
     try:
-        start_time, last_z = _get_z_start_time(conn)
+        # Lock lastzreport for the whole close so two managers can't both close the day
+        start_time, last_z = _get_z_start_time(conn, for_update=True)
+
+        central = pytz.timezone("America/Chicago")
+        if last_z and _since(last_z).astimezone(central).date() == datetime.now(central).date():
+            conn.rollback()
+            return {"already_closed": True, "since_last_z": last_z.strftime("%Y-%m-%d %H:%M:%S")}
 
         with conn.cursor() as cur:
-            # Compute totals for the range
-            cur.execute(f"""
-                SELECT COUNT(*) AS total_orders,
-                       COALESCE(SUM(total_price),0) AS total_revenue,
-                       COALESCE(SUM(tip),0) AS total_tips
-                FROM orders
-                WHERE {ORDER_TS_SQL} >= %s;
-            """, (start_time,))
-            total_orders, total_revenue, total_tips = cur.fetchone() or (0, 0, 0)
-
-            # By payment method
-            cur.execute(f"""
-                SELECT payment_method,
-                       COUNT(*) AS orders,
-                       COALESCE(SUM(total_price),0) AS revenue
-                FROM orders
-                WHERE {ORDER_TS_SQL} >= %s
-                GROUP BY payment_method
-                ORDER BY revenue DESC;
-            """, (start_time,))
-            by_payment = [
-                {"payment_method": r[0], "orders": int(r[1]), "revenue": float(r[2])}
-                for r in cur.fetchall()
-            ]
-
-            # Update last_zreport timestamp
-            cur.execute("UPDATE lastzreport SET last_ts = (NOW() AT TIME ZONE 'America/Chicago');")
-            conn.commit()
+            summary, by_payment, _ = _run_report(cur, start_time)
 
-            # Format output timestamps
-            central = pytz.timezone("America/Chicago")
-            closed_at_local = datetime.now(pytz.utc).astimezone(central)
-            last_z_str = last_z.strftime("%Y-%m-%d %H:%M:%S") if last_z else None
-
-            return {
-                "closed_at": closed_at_local.strftime("%Y-%m-%d %H:%M:%S"),
-                "since_last_z": last_z_str,
-                "summary": {
-                    "total_orders": int(total_orders or 0),
-                    "total_revenue": float(total_revenue or 0),
-                    "total_tips": float(total_tips or 0),
-                },
-                "by_payment": by_payment,
-            }
+            # Update last_zreport timestamp and start a new shift; queued orders
+            # are folded first so they count toward the shift being closed, not the next one
+            cur.execute("UPDATE lastzreport SET last_ts = (NOW() AT TIME ZONE 'America/Chicago');")
+            order_totals.fold(cur)
+            shift_totals.reset(cur)
+        conn.commit()
+
+        # Format output timestamps
+        closed_at_local = datetime.now(pytz.utc).astimezone(central)
+        last_z_str = last_z.strftime("%Y-%m-%d %H:%M:%S") if last_z else None
+
+        return {
+            "closed_at": closed_at_local.strftime("%Y-%m-%d %H:%M:%S"),
+            "since_last_z": last_z_str,
+            "summary": summary,
+            "by_payment": by_payment,
+        }
     except Exception as e:
         conn.rollback()
         print("Error in z_report_close:", e)
         return {"error": str(e)}
-    finally:
-        conn.close()
+
+
+def x_report_reconcile(repair=False):
+    """Recomputes the shift running totals from orders and reports (optionally repairs) any drift."""
+    conn = get_db()
+    if not conn:
+        return {"error": "Database connection failed"}
+
+    try:
+        if repair:
+            # Lock out folds and Z closes while we compare and rewrite; queued
+            # orders are folded first so they don't show up as drift
+            start_time, _ = _get_z_start_time(conn, for_update=True)
+            with conn.cursor() as cur:
+                order_totals.fold(cur)
+                drift = shift_totals.reconcile(cur, _since(start_time), repair=True)
+            conn.commit()
+        else:
+            # Just a look: one read-only snapshot and no locks, so it never waits
+            # on (or holds up) a Z close or the fold job. Queued orders are left
+            # out of both sides, so nothing needs folding to compare.
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+            start_time, _ = _get_z_start_time(conn)
+            with conn.cursor() as cur:
+                drift = shift_totals.reconcile(cur, _since(start_time))
+            conn.rollback()
+
+        return {
+            "since": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "in_sync": not drift,
+            "repaired": bool(repair and drift),
+            "drift": drift,
+        }
+    except Exception as e:
+        conn.rollback()
+        print("Error in x_report_reconcile:", e)
+        return {"error": str(e)}
@@ -1,4 +1,5 @@
 from app.db import get_db_connection
+from app import rollups
 
 
 # NOTE:
@@ -33,12 +34,24 @@ try:
     with open("tables/newOrders.csv", "r", newline="", encoding="utf-8") as f:
         cur.copy_expert(
             """
-            COPY orders FROM STDIN WITH (FORMAT CSV, HEADER TRUE)
+            COPY orders (order_id, time, day, month, year, total_price, tip, special_notes, payment_method, tax)
+            FROM STDIN WITH (FORMAT CSV, HEADER TRUE)
             """,
             f
         )
     print("Imported newOrders.csv → orders table")
 
+    # === Fill the materialized order timestamp for the imported rows ===
+    cur.execute(
+        """
+        UPDATE orders
+        SET ordered_at = (make_date(year, month, day) + time::time) AT TIME ZONE 'America/Chicago'
+        WHERE order_id >= %s AND ordered_at IS NULL;
+        """,
+        (firstOrderID,)
+    )
+    print("Set ordered_at for imported orders")
+
     # === IMPORT newItems.csv → items table ===
     with open("tables/newItems.csv", "r", newline="", encoding="utf-8") as f:
         cur.copy_expert(
@@ -49,6 +62,10 @@ try:
         )
     print("Imported newItems.csv → items table")
 
+    # === Add the imported orders to the dashboard rollups ===
+    rolled_up = rollups.record_orders_from(cur, firstOrderID)
+    print(f"Added {rolled_up} imported orders to the dashboard rollups")
+
     conn.commit()
 
     # === Restore lastzreport if it was wiped by reset/import ===
@@ -51,7 +51,8 @@ print(f"Exported to {local_item_csv} on your local machine")
 
 with open(local_order_csv, "w", newline="", encoding="utf-8") as f:
     cur.copy_expert(
-        r"COPY (SELECT * FROM orders) TO STDOUT WITH CSV HEADER",
+        # Same columns as newOrders.csv so the two files can be merged
+        r"COPY (SELECT order_id, time, day, month, year, total_price, tip, special_notes, payment_method, tax FROM orders) TO STDOUT WITH CSV HEADER",
         f
     )
 print(f"Exported to {local_order_csv} on your local machine")
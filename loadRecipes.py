@@ -0,0 +1,44 @@
+import csv
+import sys
+
+from app.db import get_db_connection
+from app import recipes
+
+# Loads the recipes used for inventory deduction (see app/recipes.py) from a CSV
+# with a header row: kind,key,inventory,amount
+#   all,,Lids,1                 -> every drink uses one lid
+#   size,Large,Large Cups,1     -> a Large drink uses one large cup
+#   product,12,Black Tea,0.02   -> product 12 uses 0.02 units of Black Tea
+#   topping,Boba,Boba,0.05      -> each Boba topping uses 0.05 units of Boba
+# amount is in inventory units per drink. The file replaces every recipe row.
+#   python loadRecipes.py recipes.csv
+
+if len(sys.argv) != 2:
+    print("Usage: python loadRecipes.py RECIPES.csv")
+    exit(1)
+
+try:
+    with open(sys.argv[1], newline="") as f:
+        rows = [(r["kind"].strip(), (r["key"] or "").strip(), r["inventory"].strip(), r["amount"])
+                for r in csv.DictReader(f)]
+except (OSError, KeyError) as e:
+    print(f"Could not read {sys.argv[1]}: {e}")
+    exit(1)
+
+conn = get_db_connection()
+if conn == None:
+    exit(1)
+cur = conn.cursor()
+
+try:
+    count = recipes.replace_all(cur, rows)
+    conn.commit()
+    print(f"Loaded {count} recipe rows; running servers pick them up within RECIPE_CACHE_TTL seconds")
+except Exception as e:
+    print(f"Error loading recipes: {e}")
+    print('Load rolled back...')
+    conn.rollback()
+    exit(1)
+finally:
+    cur.close()
+    conn.close()
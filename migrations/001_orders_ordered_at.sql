@@ -0,0 +1,15 @@
+-- 001: Materialized order timestamp
+--
+-- orders only stores the local (America/Chicago) wall clock split into
+-- time/day/month/year, so every report had to rebuild a timestamp per row and
+-- could never use an index. ordered_at stores the real instant once.
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS ordered_at timestamptz;
+
+UPDATE orders
+SET ordered_at = (make_date(year, month, day) + time::time) AT TIME ZONE 'America/Chicago'
+WHERE ordered_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS orders_ordered_at_idx ON orders (ordered_at);
+
+ANALYZE orders;
@@ -0,0 +1,37 @@
+-- 002: Running totals for the X report
+--
+-- One row per (business date, bucket) for every order since the last Z report.
+-- Maintained by add_order, emptied by the Z close; see app/shift_totals.py.
+
+CREATE TABLE IF NOT EXISTS shift_totals (
+    business_date date NOT NULL,
+    bucket text NOT NULL,          -- 'summary' | 'payment' | 'hour'
+    bucket_key text NOT NULL,      -- '' | payment method | 'HH:00'
+    orders integer NOT NULL DEFAULT 0,
+    revenue numeric(12,2) NOT NULL DEFAULT 0,
+    tips numeric(12,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (business_date, bucket, bucket_key)
+);
+
+-- Seed with the orders of the current shift (since the last Z, or since midnight)
+INSERT INTO shift_totals (business_date, bucket, bucket_key, orders, revenue, tips)
+SELECT business_date,
+       CASE GROUPING(payment_method, hour) WHEN 3 THEN 'summary' WHEN 1 THEN 'payment' ELSE 'hour' END,
+       CASE GROUPING(payment_method, hour) WHEN 3 THEN '' WHEN 1 THEN payment_method ELSE hour END,
+       COUNT(*),
+       COALESCE(SUM(total_price),0),
+       COALESCE(SUM(tip),0)
+FROM (
+    SELECT make_date(year, month, day) AS business_date,
+           COALESCE(payment_method, '') AS payment_method,
+           LEFT(time::text,2)||':00' AS hour,
+           total_price,
+           tip
+    FROM orders
+    WHERE ordered_at >= COALESCE(
+        (SELECT last_ts AT TIME ZONE 'America/Chicago' FROM lastzreport LIMIT 1),
+        CURRENT_DATE::timestamp AT TIME ZONE 'America/Chicago'
+    )
+) AS window_orders
+GROUP BY GROUPING SETS ((business_date), (business_date, payment_method), (business_date, hour))
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,59 @@
+-- 003: Daily rollups for the dashboard
+--
+-- Kept up to date by add_order and exportNewOrdersToDB.py; see app/rollups.py.
+-- After applying this file, fill the tables from history once with:
+--     python rebuildRollups.py
+
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    sale_date date PRIMARY KEY,
+    orders integer NOT NULL,
+    revenue numeric NOT NULL,
+    tips numeric NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS rollup_hour_daily (
+    sale_date date NOT NULL,
+    hour integer NOT NULL,
+    orders integer NOT NULL,
+    PRIMARY KEY (sale_date, hour)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_product_daily (
+    sale_date date NOT NULL,
+    product_id integer NOT NULL,
+    items integer NOT NULL,
+    revenue numeric NOT NULL,
+    PRIMARY KEY (sale_date, product_id)
+);
+CREATE INDEX IF NOT EXISTS rollup_product_daily_product_idx ON rollup_product_daily (product_id);
+
+CREATE TABLE IF NOT EXISTS rollup_size_daily (
+    sale_date date NOT NULL,
+    size text NOT NULL,
+    items integer NOT NULL,
+    revenue numeric NOT NULL,
+    PRIMARY KEY (sale_date, size)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_topping_daily (
+    sale_date date NOT NULL,
+    topping_combo text NOT NULL,
+    items integer NOT NULL,
+    revenue numeric NOT NULL,
+    base_revenue numeric NOT NULL,
+    PRIMARY KEY (sale_date, topping_combo)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_payment_daily (
+    sale_date date NOT NULL,
+    payment_method text NOT NULL,
+    orders integer NOT NULL,
+    tip_pct_sum numeric NOT NULL,
+    tip_pct_count integer NOT NULL,
+    value_sum numeric NOT NULL,
+    value_count integer NOT NULL,
+    PRIMARY KEY (sale_date, payment_method)
+);
+
+-- The "whale orders" chart looks up big orders directly
+CREATE INDEX IF NOT EXISTS orders_grand_total_idx ON orders ((total_price + tip));
@@ -0,0 +1,14 @@
+-- 004: Idempotency keys for POST /api/orders
+--
+-- One row per Idempotency-Key header, holding the response to replay on retries.
+-- Rows older than IDEMPOTENCY_KEY_TTL_HOURS are swept by the server; see app/idempotency.py.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key text PRIMARY KEY,
+    request_hash text NOT NULL,
+    status_code integer,
+    response jsonb,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idempotency_keys_created_at_idx ON idempotency_keys (created_at);
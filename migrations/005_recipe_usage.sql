@@ -0,0 +1,37 @@
+-- 005: Recipes for inventory deduction (see app/recipes.py)
+--
+-- One row per inventory item a drink uses. kind/key say when the row applies:
+--   'all'      ''            every drink (lids, straws)
+--   'size'     size name     the cup for that size
+--   'product'  product_id    the product's own ingredients (tea, milk, ...)
+--   'topping'  topping name  each topping on the drink
+-- amount is in inventory units, per drink (items.quantity drinks per item).
+--
+-- The only seed rows are the cups, lids and straws every drink already used
+-- (the old hard-coded deduction). Product and topping recipes are real data
+-- that has to come from the store: load them with loadRecipes.py. Until then
+-- orders only use up cups, lids and straws. The server picks changes up on the
+-- next product/inventory write or within RECIPE_CACHE_TTL seconds.
+
+CREATE TABLE IF NOT EXISTS recipe_usage (
+    kind text NOT NULL CHECK (kind IN ('all', 'size', 'product', 'topping')),
+    key text NOT NULL DEFAULT '',
+    inv_item_id integer NOT NULL,
+    amount numeric NOT NULL CHECK (amount >= 0),
+    PRIMARY KEY (kind, key, inv_item_id)
+);
+
+INSERT INTO recipe_usage (kind, key, inv_item_id, amount)
+SELECT 'size', s.size, inv.inv_item_id, 1
+FROM (VALUES ('Small', 'Small Cups'),
+             ('Medium', 'Medium Cups'),
+             ('Large', 'Large Cups'),
+             ('Bucee''s', 'Large Cups')) AS s(size, cup)
+JOIN inventory inv ON inv.name = s.cup
+ON CONFLICT DO NOTHING;
+
+INSERT INTO recipe_usage (kind, key, inv_item_id, amount)
+SELECT 'all', '', inv.inv_item_id, 1
+FROM inventory inv
+WHERE inv.name IN ('Lids', 'Straws')
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,14 @@
+-- 006: Inventory consumption ledger (see app/inventory_ledger.py)
+--
+-- Orders append what they used here instead of updating the inventory rows,
+-- so concurrent checkouts no longer queue on the same "Lids" / "Straws" row.
+-- A background job folds the ledger into inventory.units_remaining.
+
+CREATE TABLE IF NOT EXISTS inventory_ledger (
+    entry_id bigserial PRIMARY KEY,
+    inv_item_id integer NOT NULL,
+    change numeric NOT NULL,   -- units used (positive = taken out of stock)
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS inventory_ledger_item_idx ON inventory_ledger (inv_item_id);
@@ -0,0 +1,13 @@
+-- 007: Persistent translation cache (see app/translate.py)
+--
+-- One row per (target language, source text). The source text is keyed by its
+-- md5 so long strings don't hit the btree row size limit.
+
+CREATE TABLE IF NOT EXISTS translations (
+    target_language text NOT NULL,
+    source_hash text NOT NULL,
+    source_text text NOT NULL,
+    translated_text text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (target_language, source_hash)
+);
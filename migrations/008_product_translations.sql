@@ -0,0 +1,15 @@
+-- 008: Pre-translated product catalog (see app/menu_translations.py)
+--
+-- One row per product and language with the translated text fields as JSON,
+-- e.g. {"product_name": "Té con leche", "category": "Té con leche", ...}.
+-- source_hash is a hash of the English fields the row was made from, so the
+-- warm-up job can tell which rows are out of date.
+
+CREATE TABLE IF NOT EXISTS product_translations (
+    product_id integer NOT NULL,
+    language text NOT NULL,
+    fields jsonb NOT NULL,
+    source_hash text NOT NULL,
+    translated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (product_id, language)
+);
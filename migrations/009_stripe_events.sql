@@ -0,0 +1,28 @@
+-- 009: Stripe webhook event store (see app/stripe_events.py)
+--
+-- Every verified webhook is stored here once, keyed by Stripe's event id, so
+-- redeliveries are dropped. A background worker works through the pending rows;
+-- replayStripeEvents.py puts rows back in the queue.
+--
+-- orders.payment_intent_id links an order to the PaymentIntent the server created
+-- for it (one intent per order), and paid_at is set when Stripe confirms it.
+
+CREATE TABLE IF NOT EXISTS stripe_events (
+    event_id text PRIMARY KEY,
+    event_type text NOT NULL,
+    payload jsonb NOT NULL,
+    received_at timestamptz NOT NULL DEFAULT now(),
+    status text NOT NULL DEFAULT 'pending',   -- pending, done or failed
+    attempts integer NOT NULL DEFAULT 0,
+    next_attempt_at timestamptz NOT NULL DEFAULT now(),
+    processed_at timestamptz,
+    last_error text
+);
+
+CREATE INDEX IF NOT EXISTS stripe_events_pending_idx ON stripe_events (next_attempt_at) WHERE status = 'pending';
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS payment_intent_id text;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS paid_at timestamptz;
+
+DROP INDEX IF EXISTS orders_payment_intent_id_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS orders_payment_intent_id_key ON orders (payment_intent_id) WHERE payment_intent_id IS NOT NULL;
@@ -0,0 +1,7 @@
+-- 010: Discount applied to an order (see app/discounts.py)
+--
+-- add_order checks a discounted order's total against the code on the server
+-- and records which code was used and how much it took off.
+
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS discount_code text;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS discount_amount numeric;
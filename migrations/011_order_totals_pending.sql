@@ -0,0 +1,10 @@
+-- 011: Orders not yet counted in shift_totals and the rollups (see app/order_totals.py)
+--
+-- Checkouts used to upsert the same few counter rows (today's summary, payment
+-- and hour buckets, today's rollup_daily row...), so they queued on each other's
+-- row locks. Now an order only appends its id here and a background job folds
+-- the queued orders into those tables in bulk.
+
+CREATE TABLE IF NOT EXISTS order_totals_pending (
+    order_id integer PRIMARY KEY
+);
@@ -0,0 +1,34 @@
+import sys
+from datetime import datetime
+
+from app.db import get_db_connection
+from app import rollups
+
+# Recomputes the dashboard rollup tables (see app/rollups.py) from the orders/items history.
+#   python rebuildRollups.py              -> everything
+#   python rebuildRollups.py 2025-11-01   -> only the days from that date on
+
+since = None
+if len(sys.argv) > 1:
+    try:
+        since = datetime.strptime(sys.argv[1], "%Y-%m-%d").date()
+    except ValueError:
+        print("Usage: python rebuildRollups.py [YYYY-MM-DD]")
+        exit(1)
+
+conn = get_db_connection()
+if conn == None:
+    exit(1)
+cur = conn.cursor()
+
+try:
+    count = rollups.rebuild(cur, since)
+    conn.commit()
+    print(f"Rolled up {count} orders" + (f" since {since}" if since else ""))
+except Exception as e:
+    print(f"Error rebuilding rollups: {e}")
+    print('Rebuild rolled back...')
+    conn.rollback()
+finally:
+    cur.close()
+    conn.close()
@@ -0,0 +1,51 @@
+import sys
+from datetime import datetime
+
+from app.db import get_db_connection
+from app import stripe_events
+
+# Re-runs stored Stripe webhook events (see app/stripe_events.py).
+#   python replayStripeEvents.py                     -> every event that was given up as 'failed'
+#   python replayStripeEvents.py evt_123 evt_456     -> just those events, even if already done
+#   python replayStripeEvents.py --since 2025-11-01  -> every event received from that date on
+# Replaying is safe: an order that is already paid keeps its original paid_at.
+
+event_ids = sys.argv[1:]
+since = None
+if event_ids[:1] == ["--since"]:
+    try:
+        since = datetime.strptime(event_ids[1], "%Y-%m-%d").date()
+    except (IndexError, ValueError):
+        print("Usage: python replayStripeEvents.py [--since YYYY-MM-DD | EVENT_ID ...]")
+        exit(1)
+    event_ids = []
+
+conn = get_db_connection()
+if conn == None:
+    exit(1)
+cur = conn.cursor()
+
+try:
+    count = stripe_events.requeue(cur, event_ids, since)
+    conn.commit()
+    print(f"Queued {count} events for replay")
+except Exception as e:
+    print(f"Error queueing events: {e}")
+    conn.rollback()
+    exit(1)
+finally:
+    cur.close()
+    conn.close()
+
+# Work through the queue here instead of waiting for the server's worker
+while stripe_events.process_pending() > 0:
+    pass
+
+conn = get_db_connection()
+if conn == None:
+    exit(1)
+cur = conn.cursor()
+status = stripe_events.counts(cur)
+cur.close()
+conn.close()
+print(f"Events: {status.get('done', 0)} done, {status.get('pending', 0)} pending, {status.get('failed', 0)} failed")